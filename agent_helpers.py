@@ -0,0 +1,322 @@
+"""Helpers shared by the tool-calling agents of lessons 2, 4 and 5, and the state reducers
+of lessons 5 and 6."""
+import asyncio
+import inspect
+import threading
+import time
+from collections import OrderedDict, deque
+from uuid import uuid4
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from langchain_community.tools.tavily_search import TavilySearchResults
+from langchain_core.messages import AnyMessage, SystemMessage, ToolMessage
+from langchain_core.runnables import RunnableLambda
+from langchain_core.runnables.utils import accepts_config
+
+from search_helpers import SearchCache
+
+
+# Reducers
+def reduce_messages(left: list[AnyMessage], right: list[AnyMessage]) -> list[AnyMessage]:
+    """Replaces messages of left with the message of right that has the same id
+    (keeping its position), appends the others. Messages without id get one.
+
+    Messages are looked up in an id -> position dict built once per call, so each
+    message of right is O(1) instead of a scan of the whole conversation.
+    """
+    # assign ids to messages that don't have them
+    for message in right:
+        if not message.id:
+            message.id = str(uuid4())
+    merged = left.copy()
+    index = {}
+    for i, existing in enumerate(merged):
+        index.setdefault(existing.id, i)  # the first message with an id is the one replaced
+    for message in right:
+        i = index.get(message.id)
+        if i is None:
+            # append any new messages to the end
+            index[message.id] = len(merged)
+            merged.append(message)
+        else:
+            # replace any existing messages with the same id
+            merged[i] = message
+    return merged
+
+
+def reduce_content(left: list[str], right: list[str]) -> list[str]:
+    """Appends the snippets of right that aren't in left yet, so research nodes
+    return only what they found and each snippet is kept once. Existing snippets
+    are never changed or reordered: content is append-only.
+
+    The snippets already in left are put in a set once per call, so each snippet
+    of right is O(1) instead of a scan of the whole list.
+    """
+    merged = left.copy()
+    seen = set(merged)
+    for item in right or []:
+        if item not in seen:
+            seen.add(item)
+            merged.append(item)
+    return merged
+
+
+# Tool execution
+def _tool_timeout(timeout, name):
+    # timeout can be a single value for every tool or a {tool_name: seconds} dict
+    if isinstance(timeout, dict):
+        return timeout.get(name)
+    return timeout
+
+
+def _bad_tool_message(t):
+    print("\n ....bad tool name....")
+    return ToolMessage(tool_call_id=t['id'], name=t['name'], content="bad tool name, retry")
+
+
+def _timeout_message(t):
+    print(f"\n ....timeout calling {t['name']}....")
+    return ToolMessage(tool_call_id=t['id'], name=t['name'], content="tool call timed out, retry")
+
+
+def run_tool_calls(tools, tool_calls, max_concurrency=4, timeout=None):
+    """Runs tool_calls on a thread pool, max_concurrency at a time, and returns one
+    ToolMessage per call, in the same order as tool_calls (the order the LLM asked
+    for them). A call's timeout counts from when it starts running, the next call
+    starts when one finishes or times out.
+
+    max_concurrency caps the calls being waited for: a call that timed out can't be
+    stopped, its thread finishes in the background and isn't counted (counting it
+    would let one hung tool hold up every call after it). An exception raised by a
+    tool propagates, like tool.invoke."""
+    if not tool_calls:
+        return []
+    for t in tool_calls:
+        print(f"Calling: {t}")
+    results = [None] * len(tool_calls)
+    queued = deque()
+    for i, t in enumerate(tool_calls):
+        if t['name'] in tools:
+            queued.append(i)
+        else:  # check for bad tool name from LLM
+            results[i] = _bad_tool_message(t)
+    # a thread per call: timed out calls keep theirs, they finish in the background
+    executor = ThreadPoolExecutor(max_workers=max(1, len(queued)))
+    running = {}  # future -> (index, deadline)
+    try:
+        while queued or running:
+            while queued and len(running) < max(1, max_concurrency):
+                i = queued.popleft()
+                t = tool_calls[i]
+                limit = _tool_timeout(timeout, t['name'])
+                future = executor.submit(tools[t['name']].invoke, t['args'])
+                running[future] = (i, None if limit is None else time.monotonic() + limit)
+            deadlines = [deadline for _, deadline in running.values() if deadline is not None]
+            wait(running, timeout=max(0, min(deadlines) - time.monotonic()) if deadlines else None,
+                 return_when=FIRST_COMPLETED)
+            now = time.monotonic()
+            for future, (i, deadline) in list(running.items()):
+                t = tool_calls[i]
+                if future.done():
+                    results[i] = ToolMessage(tool_call_id=t['id'], name=t['name'], content=str(future.result()))
+                elif deadline is not None and now >= deadline:
+                    results[i] = _timeout_message(t)
+                else:
+                    continue
+                del running[future]
+    finally:
+        # don't wait for the calls still running (timed out, or next to the one that raised)
+        executor.shutdown(wait=False, cancel_futures=True)
+    return results
+
+
+async def arun_tool_calls(tools, tool_calls, max_concurrency=4, timeout=None):
+    """Async version of run_tool_calls. Uses tool.ainvoke and asyncio.gather,
+    which keeps the results in tool_call order."""
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def call(t):
+        print(f"Calling: {t}")
+        if t['name'] not in tools:
+            return _bad_tool_message(t)
+        async with semaphore:
+            try:
+                result = await asyncio.wait_for(tools[t['name']].ainvoke(t['args']),
+                                                _tool_timeout(timeout, t['name']))
+            except asyncio.TimeoutError:
+                return _timeout_message(t)
+        return ToolMessage(tool_call_id=t['id'], name=t['name'], content=str(result))
+
+    return list(await asyncio.gather(*(call(t) for t in tool_calls)))
+
+
+# Tools
+class CachedTavilySearchResults(TavilySearchResults):
+    """TavilySearchResults that answers repeated queries (same normalized query and
+    search settings) from a SearchCache. Errors are returned as before and not cached."""
+    cache: SearchCache = None
+
+    def _params(self):
+        return {"max_results": self.max_results, "search_depth": self.search_depth,
+                "include_domains": self.include_domains, "exclude_domains": self.exclude_domains,
+                "include_answer": self.include_answer, "include_raw_content": self.include_raw_content,
+                "include_images": self.include_images}
+
+    def _run(self, query, run_manager=None):
+        if self.cache is None:
+            return super()._run(query, run_manager)
+        key = self.cache.key(self.name, query, **self._params())
+        result = self.cache.get(key)
+        if result is None:
+            result = super()._run(query, run_manager)
+            if not isinstance(result, str):  # str is an error message
+                self.cache.set(key, result)
+        return result
+
+    async def _arun(self, query, run_manager=None):
+        if self.cache is None:
+            return await super()._arun(query, run_manager)
+        key = self.cache.key(self.name, query, **self._params())
+        result = self.cache.get(key)
+        if result is None:
+            result = await super()._arun(query, run_manager)
+            if not isinstance(result, str):
+                self.cache.set(key, result)
+        return result
+
+
+# Graph and model reuse
+class GraphRegistry:
+    """Compiled graphs and tool-bound models, built once and shared by every agent.
+
+    graph() compiles a graph once per key (node topology, state schema...) and
+    interrupts, then hands out copies with the checkpointer of the caller: a
+    shallow copy of the compiled graph, not a recompile. bound_model() calls
+    model.bind_tools(tools) once per model and tool set (the tool schemas are
+    converted once), the last maxsize are kept. Safe to share between threads.
+    """
+
+    def __init__(self, maxsize=32):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._graphs = {}  # (key, interrupt_before, interrupt_after) -> compiled graph, no checkpointer
+        self._models = OrderedDict()  # (id(model), ids of the tools) -> (model, tools, bound model)
+        self._lock = threading.Lock()
+
+    def graph(self, key, build, checkpointer=None, interrupt_before=None, interrupt_after=None):
+        """The graph build() returns (a StateGraph) compiled, with checkpointer."""
+        key = (key, tuple(interrupt_before or ()), tuple(interrupt_after or ()))
+        with self._lock:
+            compiled = self._graphs.get(key)
+            if compiled is None:
+                self.misses += 1
+                compiled = build().compile(checkpointer=checkpointer, interrupt_before=interrupt_before,
+                                           interrupt_after=interrupt_after)
+                self._graphs[key] = compiled.copy(update={"checkpointer": None})
+                return compiled
+            self.hits += 1
+        return with_checkpointer(compiled, checkpointer)
+
+    def bound_model(self, model, tools):
+        """model.bind_tools(tools), cached on the model and tool objects."""
+        tools = list(tools)
+        key = (id(model), tuple(id(t) for t in tools))
+        with self._lock:
+            entry = self._models.get(key)
+            if entry is not None and entry[0] is model:  # ids can be reused once objects are gone
+                self._models.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+        bound = model.bind_tools(tools)
+        with self._lock:
+            # keeping model and tools keeps their ids from being reused
+            self._models[key] = (model, tools, bound)
+            while len(self._models) > self.maxsize:
+                self._models.popitem(last=False)
+        return bound
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "graphs": len(self._graphs), "models": len(self._models)}
+
+
+graphs = GraphRegistry()
+
+
+def with_checkpointer(graph, checkpointer):
+    """Copy of a compiled graph using checkpointer, e.g. an AsyncSqliteSaver for
+    astream_events. Nothing is recompiled."""
+    if checkpointer is None and (graph.interrupt_before_nodes or graph.interrupt_after_nodes):
+        raise ValueError("Interrupts require a checkpointer")
+    return graph.copy(update={"checkpointer": checkpointer})
+
+
+def agent_node(name, aname=None):
+    """Graph node calling the method name (aname when the graph runs async) of the
+    agent in the config's "agent", with the config if the method takes one. Graphs
+    made of such nodes don't depend on the agent, one compiled graph serves all of
+    them (see BoundGraph)."""
+    def node(state, config):
+        method = getattr(config["configurable"]["agent"], name)
+        return method(state, config=config) if accepts_config(method) else method(state)
+
+    async def anode(state, config):
+        method = getattr(config["configurable"]["agent"], aname)
+        return await (method(state, config=config) if accepts_config(method) else method(state))
+
+    return RunnableLambda(node, afunc=anode if aname else None, name=name)
+
+
+class BoundGraph:
+    """A shared compiled graph seen through one agent: configurable (e.g. {"agent":
+    agent}) is added to the config of every call (invoke, stream, get_state...,
+    a model or thread_id given in the call's config wins). Everything else is the
+    graph's."""
+
+    def __init__(self, graph, configurable):
+        self.graph = graph
+        self.configurable = configurable
+        self._signatures = {}  # method name -> signature
+
+    def _config(self, config):
+        config = dict(config or {})
+        config["configurable"] = {**self.configurable, **config.get("configurable", {})}
+        return config
+
+    def with_checkpointer(self, checkpointer):
+        return BoundGraph(with_checkpointer(self.graph, checkpointer), self.configurable)
+
+    def __getattr__(self, name):
+        attr = getattr(self.graph, name)
+        if not callable(attr):
+            return attr
+        if name not in self._signatures:
+            try:
+                self._signatures[name] = inspect.signature(attr)
+            except (TypeError, ValueError):
+                self._signatures[name] = None
+        signature = self._signatures[name]
+        if signature is None or "config" not in signature.parameters:
+            return attr
+
+        def call(*args, **kwargs):
+            bound = signature.bind_partial(*args, **kwargs)
+            bound.arguments["config"] = self._config(bound.arguments.get("config"))
+            return attr(*bound.args, **bound.kwargs)
+        return call
+
+
+# LLM requests
+class AgentPrompt:
+    """The system message an agent puts in front of the conversation on every LLM
+    turn, made once instead of on every turn. The request itself is still built and
+    serialized whole by ChatOpenAI each turn; the system message staying first and
+    unchanged only keeps the prefix stable for OpenAI's automatic prompt caching."""
+
+    def __init__(self, system=""):
+        self.system = SystemMessage(content=system) if system else None
+
+    def messages(self, history):
+        """System message + history, the messages of this turn's request."""
+        return [self.system, *history] if self.system else list(history)
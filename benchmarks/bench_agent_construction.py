@@ -0,0 +1,132 @@
+"""Cost of building the tool-calling Agent of lessons 2, 4 and 5 per request, like a
+server making one agent per request: StateGraph + compile() + bind_tools every
+time vs the shared compiled graph and bound model of agent_helpers.graphs.
+
+Startup is the first agent (everything built), per request the next ones. The
+model is a ChatOpenAI (not called, no API key needed) and the tools are the
+Tavily tool plus a few local ones, bind_tools converts all their schemas.
+
+    python benchmarks/bench_agent_construction.py
+"""
+import operator
+import os
+import statistics
+import sys
+import time
+from typing import Annotated, TypedDict
+
+os.environ.setdefault("OPENAI_API_KEY", "not-used")
+os.environ.setdefault("TAVILY_API_KEY", "not-used")
+
+from langchain_core.messages import AnyMessage
+from langchain_core.runnables import RunnableLambda
+from langchain_core.tools import tool
+from langchain_openai import ChatOpenAI
+from langgraph.checkpoint.sqlite import SqliteSaver
+from langgraph.graph import END, StateGraph
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from agent_helpers import BoundGraph, CachedTavilySearchResults, GraphRegistry, agent_node
+from search_helpers import SearchCache
+
+REQUESTS = 200
+
+
+class AgentState(TypedDict):
+    messages: Annotated[list[AnyMessage], operator.add]
+
+
+@tool
+def weather(city: str, unit: str = "F") -> str:
+    """Current weather of city."""
+    return f"sunny in {city}"
+
+
+@tool
+def forecast(city: str, days: int = 3) -> str:
+    """Weather forecast of city for the next days."""
+    return f"sunny in {city} for {days} days"
+
+
+@tool
+def convert(value: float, from_unit: str, to_unit: str) -> float:
+    """Converts value between units."""
+    return value
+
+
+TOOLS = [CachedTavilySearchResults(max_results=2, cache=SearchCache()), weather, forecast, convert]
+
+
+def exists_action(state):
+    return len(state['messages'][-1].tool_calls) > 0
+
+
+class RebuiltAgent:
+    # the lessons' Agent before: its own graph, compiled, and its own bound model
+    def __init__(self, model, tools, checkpointer=None, system=""):
+        self.system = system
+        graph = StateGraph(AgentState)
+        graph.add_node("llm", self.call_openai)
+        graph.add_node("action", RunnableLambda(self.take_action, afunc=self.atake_action))
+        graph.add_conditional_edges("llm", exists_action, {True: "action", False: END})
+        graph.add_edge("action", "llm")
+        graph.set_entry_point("llm")
+        self.graph = graph.compile(checkpointer=checkpointer, interrupt_before=["action"])
+        self.tools = {t.name: t for t in tools}
+        self.model = model.bind_tools(tools)
+
+    def call_openai(self, state):
+        pass
+
+    def take_action(self, state):
+        pass
+
+    async def atake_action(self, state):
+        pass
+
+
+def build_graph():
+    graph = StateGraph(AgentState)
+    graph.add_node("llm", agent_node("call_openai"))
+    graph.add_node("action", agent_node("take_action", "atake_action"))
+    graph.add_conditional_edges("llm", exists_action, {True: "action", False: END})
+    graph.add_edge("action", "llm")
+    graph.set_entry_point("llm")
+    return graph
+
+
+class SharedAgent(RebuiltAgent):
+    # the lessons' Agent now
+    graphs = None
+
+    def __init__(self, model, tools, checkpointer=None, system=""):
+        self.system = system
+        self.graph = BoundGraph(self.graphs.graph(("agent", AgentState), build_graph, checkpointer,
+                                                  interrupt_before=["action"]), {"agent": self})
+        self.tools = {t.name: t for t in tools}
+        self.model = self.graphs.bound_model(model, tools)
+
+
+def run(name, cls, model, checkpointer):
+    start = time.perf_counter()
+    cls(model, TOOLS, checkpointer)
+    startup = time.perf_counter() - start
+    times = []
+    for _ in range(REQUESTS):
+        start = time.perf_counter()
+        cls(model, TOOLS, checkpointer)
+        times.append(time.perf_counter() - start)
+    print(f"{name:<34} {startup * 1e3:9.2f} ms {statistics.median(times) * 1e3:9.3f} ms "
+          f"{len(times) / sum(times):12.0f}")
+
+
+if __name__ == "__main__":
+    model = ChatOpenAI(model="gpt-3.5-turbo")
+    checkpointer = SqliteSaver.from_conn_string(":memory:")
+    RebuiltAgent(ChatOpenAI(model="gpt-3.5-turbo"), TOOLS, checkpointer)  # one-time import and schema warm-up
+    print(f"{len(TOOLS)} tools, {REQUESTS} agents after the first one")
+    print(f"{'agent':<34} {'startup':>12} {'per request':>12} {'agents/s':>12}")
+    run("compile + bind_tools per agent", RebuiltAgent, model, checkpointer)
+    SharedAgent.graphs = GraphRegistry()
+    run("GraphRegistry", SharedAgent, model, checkpointer)
+    print(SharedAgent.graphs.stats())
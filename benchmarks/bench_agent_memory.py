@@ -0,0 +1,60 @@
+"""Tokens sent per turn by lesson 1's Agent over a long ReAct loop: the whole
+conversation every turn (no budget) vs react_helpers.ConversationMemory with a
+token budget, the oldest turns folded into an extractive summary (compact_turns)
+or dropped.
+
+Each turn is a Thought/Action response and a ~600 character Observation, like
+the search results of a research loop. Nothing is sent: the messages of each
+request are built and counted.
+
+    python benchmarks/bench_agent_memory.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from context_helpers import count_tokens
+from react_helpers import ConversationMemory
+
+TURNS = 30
+BUDGET = 1500
+SYSTEM = ("You run in a loop of Thought, Action, PAUSE, Observation. At the end of the loop you output an Answer. "
+          "Use Thought to describe your thoughts about the question you have been asked. ") * 6
+OBSERVATION = ("Observation: {i}. The average weight of the breed is {w} lbs, adult males are slightly heavier "
+               "than females. Sources disagree on the upper range, kennel club standards list a broader spread. ") * 3
+
+
+def response(i):
+    return (f"Thought: I need the weight of breed {i} before adding it to the total.\n"
+            f"Action: average_dog_weight: breed {i}\nPAUSE")
+
+
+def run(name, memory):
+    sent = []
+    seconds = 0.0
+    memory.transcript.append({"role": "user", "content": "What is the combined weight of these 30 dogs?"})
+    for i in range(TURNS):
+        start = time.perf_counter()
+        memory.next_request()
+        seconds += time.perf_counter() - start
+        sent.append(memory.last.sent)
+        memory.transcript.append({"role": "assistant", "content": response(i)})
+        memory.transcript.append({"role": "user", "content": OBSERVATION.format(i=i, w=20 + i)})
+    last = memory.last
+    print(f"{name:<26} {sum(sent):10} {sent[9]:8} {sent[-1]:8} {max(sent):8} {last.compacted:10} "
+          f"{seconds * 1e3 / TURNS:9.3f} ms")
+    return sent
+
+
+if __name__ == "__main__":
+    count_tokens(SYSTEM)  # loads the tokenizer, once
+    print(f"{TURNS} turns, budget {BUDGET} tokens")
+    print(f"{'memory':<26} {'total sent':>10} {'turn 10':>8} {'turn 30':>8} {'max':>8} {'compacted':>10} "
+          f"{'CPU/turn':>12}")
+    full = run("no budget", ConversationMemory(SYSTEM))
+    memory = ConversationMemory(SYSTEM, BUDGET)
+    summarized = run("budget, summarized", memory)
+    dropped = run("budget, dropped", ConversationMemory(SYSTEM, BUDGET, summarize=None))
+    print(f"saved: {1 - sum(summarized) / sum(full):.0%} summarized, {1 - sum(dropped) / sum(full):.0%} dropped")
+    print(f"\nlast request summarized, {memory.last.report()}\nsummary:\n{memory.summary[:400]}...")
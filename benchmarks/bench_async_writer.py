@@ -0,0 +1,131 @@
+"""Load test of the essay writer (lesson6-gui.py): how many essays one worker
+runs at a time, sync ewriter vs async aewriter.
+
+A sync gradio handler holds its worker thread for the whole essay, so a worker
+runs one essay at a time. aewriter awaits the LLM, so one event loop runs
+them all concurrently. The LLM and Tavily are local fakes with a fixed latency,
+no API keys or network needed. Each essay runs to the end (2 revisions:
+7 LLM calls, 3 rounds of searches), checkpointed to a sqlite file.
+
+    python benchmarks/bench_async_writer.py
+"""
+import asyncio
+import importlib.util
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.runnables import RunnableLambda
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+sys.path.insert(0, ROOT)
+os.environ.setdefault("OPENAI_API_KEY", "not-used")
+os.environ.setdefault("TAVILY_API_KEY", "not-used")
+
+spec = importlib.util.spec_from_file_location("lesson6_gui", os.path.join(ROOT, "lesson6-gui.py"))
+lesson6_gui = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(lesson6_gui)
+
+LLM_LATENCY = 0.2  # s per LLM call
+SEARCH_LATENCY = 0.1  # s per search
+REPLY = "A fake reply of the essay writer model. " * 20
+
+
+class FakeLLM(BaseChatModel):
+    latency: float = LLM_LATENCY
+
+    @property
+    def _llm_type(self):
+        return "fake-latency"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=REPLY))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=REPLY))])
+
+    def with_structured_output(self, schema, **kwargs):
+        def queries(messages):
+            time.sleep(self.latency)
+            return schema(queries=["query one", "query two"])
+
+        async def aqueries(messages):
+            await asyncio.sleep(self.latency)
+            return schema(queries=["query one", "query two"])
+
+        return RunnableLambda(queries, afunc=aqueries)
+
+
+class FakeSearch:
+    def search(self, query, max_results=2, **kwargs):
+        time.sleep(SEARCH_LATENCY)
+        return {"results": [{"content": f"{query}: result {i}"} for i in range(max_results)]}
+
+
+def new_essay(task):
+    return {'task': task, "max_revisions": 2, "revision_number": 0, 'lnode': "",
+            'content': ["no content"], 'count': 0}
+
+
+def make(cls, db_path):
+    writer = cls(db_path=db_path)
+    writer.model = FakeLLM()
+    writer.tavily = FakeSearch()
+    return writer
+
+
+def essay(graph, thread_id):
+    # like run_agent: the graph interrupts after every node, continue until the end
+    thread = {"configurable": {"thread_id": thread_id}}
+    start = time.perf_counter()
+    graph.invoke(new_essay("pizza shop"), thread)
+    while graph.get_state(thread).next:
+        graph.invoke(None, thread)
+    return time.perf_counter() - start
+
+
+async def aessay(graph, thread_id):
+    thread = {"configurable": {"thread_id": thread_id}}
+    start = time.perf_counter()
+    await graph.ainvoke(new_essay("pizza shop"), thread)
+    while (await graph.aget_state(thread)).next:
+        await graph.ainvoke(None, thread)
+    return time.perf_counter() - start
+
+
+def report(name, sessions, total, latencies):
+    print(f"{name:<8} {sessions:>9} {total:>8.2f} s {sessions / total:>9.2f} {statistics.median(latencies):>9.2f} s "
+          f"{max(latencies):>9.2f} s")
+
+
+async def run_async(writer, sessions):
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*(aessay(writer.graph, f"async-{sessions}-{i}") for i in range(sessions)))
+    report("async", sessions, time.perf_counter() - start, latencies)
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"LLM call {LLM_LATENCY * 1e3:.0f} ms, search {SEARCH_LATENCY * 1e3:.0f} ms, one worker")
+        print(f"{'writer':<8} {'sessions':>9} {'total':>10} {'essays/s':>9} {'p50':>11} {'max':>11}")
+        writer = make(lesson6_gui.ewriter, os.path.join(tmp, "sync.sqlite"))
+        sessions = 4
+        start = time.perf_counter()
+        latencies = [essay(writer.graph, f"sync-{i}") for i in range(sessions)]  # one worker: one after another
+        report("sync", sessions, time.perf_counter() - start, latencies)
+
+        awriter = make(lesson6_gui.aewriter, os.path.join(tmp, "async.sqlite"))
+
+        async def main():
+            for sessions in [1, 10, 50, 100]:
+                await run_async(awriter, sessions)
+            await awriter.graph.checkpointer.aclose()
+
+        asyncio.run(main())
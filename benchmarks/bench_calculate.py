@@ -0,0 +1,73 @@
+"""Expressions per second through lesson 1's calculate action: eval (parses and
+compiles every call) vs calc_helpers.evaluate (parsed once per expression, LRU
+cached, arithmetic only), over a corpus of model-style expressions that repeat
+like they do across the turns of an agent loop. Then the cost of expressions
+that would stall the loop: evaluate refuses them, eval runs them.
+
+    python benchmarks/bench_calculate.py
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from calc_helpers import CalcError, compile_expression, evaluate
+
+CALLS = 50_000
+UNIQUE = 300
+TEMPLATES = [
+    "{a} + {b}",
+    "{a} * {b} / {c}",
+    "({a} + {b}) * {c}.5",
+    "round({a} / {c}.2, 2)",
+    "{a} * 2.2046",
+    "({a} + {b} + {c}) / 3",
+    "{a} ** 2 + {b} ** 2",
+    "abs({a} - {b}) * 0.45359237",
+    "max({a}, {b}) - min({a}, {c})",
+    "{a} // {c} + {a} % {c}",
+]
+
+
+def corpus(seed=0):
+    rng = random.Random(seed)
+    unique = [rng.choice(TEMPLATES).format(a=rng.randint(1, 500), b=rng.randint(1, 500), c=rng.randint(1, 20))
+              for _ in range(UNIQUE)]
+    return [rng.choice(unique) for _ in range(CALLS)]
+
+
+def run(name, fn, expressions):
+    start = time.perf_counter()
+    results = [fn(expression) for expression in expressions]
+    seconds = time.perf_counter() - start
+    print(f"{name:<30} {len(expressions) / seconds:12.0f} {seconds / len(expressions) * 1e6:9.2f} us")
+    return results
+
+
+def first_call(fn, expression):
+    start = time.perf_counter()
+    try:
+        value = fn(expression)
+        result = f"= {value.bit_length()} bit int" if isinstance(value, int) else f"= {value}"
+    except CalcError as e:
+        result = f"CalcError: {str(e)[:50]}"
+    return f"{(time.perf_counter() - start) * 1e3:9.3f} ms  {result}"
+
+
+if __name__ == "__main__":
+    expressions = corpus()
+    print(f"{CALLS} calls, {UNIQUE} different expressions")
+    print(f"{'calculate':<30} {'per second':>12} {'per call':>12}")
+    before = run("eval", eval, expressions)
+    compile_expression.cache_clear()
+    after = run("evaluate, LRU cached", evaluate, expressions)
+    assert before == after
+    compile_expression.cache_clear()
+    run("evaluate, cache cleared each call", lambda e: (compile_expression.cache_clear(), evaluate(e))[1],
+        expressions[:5000])
+
+    print("\nexpressions that stall the loop, first call")
+    print(f"{'eval 9**9**6':<30} {first_call(eval, '9**9**6')}")  # 9**9**9 would run for hours
+    for expression in ["9**9**9", "10**10**10 * 2", "+".join(["1"] * 500), "__import__('os').getcwd()"]:
+        print(f"{'evaluate ' + expression[:20]:<30} {first_call(evaluate, expression)}")
@@ -0,0 +1,90 @@
+"""Checkpoint bytes and write time of the research steps of the essay writer
+(lesson 6): content as a plain list channel that the research nodes extend and
+return whole, on a SqliteSaver, vs the append-only reduce_content channel on a
+DeltaSqliteSaver. Every research step finds 6 snippets, 2 of them already found.
+
+    python benchmarks/bench_content_channel.py
+"""
+import os
+import sqlite3
+import sys
+import time
+from typing import Annotated, List, TypedDict
+
+from langgraph.checkpoint.sqlite import SqliteSaver
+from langgraph.graph import END, StateGraph
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from agent_helpers import reduce_content
+from checkpoint_helpers import DeltaSqliteSaver
+
+RESEARCH_STEPS = 40
+SNIPPET = "Pizza shops in the area compete on delivery time, dough quality and price. " * 6  # ~450 chars
+
+
+def found(step):
+    # 4 new snippets and 2 repeated from the previous step, like overlapping search results
+    return [f"{step}.{i} {SNIPPET}" for i in range(4)] + [f"{step - 1}.{i} {SNIPPET}" for i in range(2)]
+
+
+class ListState(TypedDict):
+    content: List[str]
+    step: int
+
+
+class ReducedState(TypedDict):
+    content: Annotated[List[str], reduce_content]
+    step: int
+
+
+def research_extend(state):
+    # the previous research nodes: extend the state's list and return all of it
+    content = state['content'] or []
+    content.extend(found(state['step']))
+    return {"content": content, "step": state['step'] + 1}
+
+
+def research_new(state):
+    return {"content": found(state['step']), "step": state['step'] + 1}
+
+
+def build_graph(schema, node, checkpointer):
+    graph = StateGraph(schema)
+    graph.add_node("research", node)
+    graph.add_conditional_edges("research", lambda state: state['step'] <= RESEARCH_STEPS, {True: "research", False: END})
+    graph.set_entry_point("research")
+    return graph.compile(checkpointer=checkpointer)
+
+
+def run(name, schema, node, saver):
+    seconds = 0.0
+    put = saver.put
+
+    def timed_put(*args, **kwargs):
+        nonlocal seconds
+        start = time.perf_counter()
+        try:
+            return put(*args, **kwargs)
+        finally:
+            seconds += time.perf_counter() - start
+    saver.put = timed_put
+    graph = build_graph(schema, node, saver)
+    thread = {"configurable": {"thread_id": "1"}, "recursion_limit": RESEARCH_STEPS + 10}
+    graph.invoke({"content": [], "step": 1}, thread)
+    rows = saver.conn.execute("SELECT length(checkpoint) + length(metadata) FROM checkpoints "
+                              "ORDER BY thread_ts").fetchall()
+    last = sorted(size for size, in rows[-10:])[5]  # median of the last rows, snapshots aside
+    content = graph.get_state(thread).values["content"]
+    print(f"{name:<36} {sum(size for size, in rows) / 1e6:8.2f} MB {last / 1e3:10.1f} kB "
+          f"{seconds / len(rows) * 1e3:9.2f} ms {len(content):9}")
+    return content
+
+
+if __name__ == "__main__":
+    print(f"{RESEARCH_STEPS} research steps, 6 snippets of ~{len(SNIPPET)} chars each")
+    print(f"{'content channel':<36} {'stored':>11} {'late row':>13} {'put/step':>12} {'snippets':>9}")
+    plain = run("list, extended in place / SqliteSaver", ListState, research_extend,
+                SqliteSaver(sqlite3.connect(":memory:", check_same_thread=False)))
+    reduced = run("reduce_content / DeltaSqliteSaver", ReducedState, research_new,
+                  DeltaSqliteSaver(sqlite3.connect(":memory:", check_same_thread=False)))
+    assert reduced == list(dict.fromkeys(plain))
@@ -0,0 +1,82 @@
+"""Checkpoint storage size and write latency: SqliteSaver (full snapshots) vs
+DeltaSqliteSaver (list deltas + periodic snapshots), on a lesson 5 style
+messages thread where every step adds one message.
+
+    python benchmarks/bench_delta_checkpoints.py
+"""
+import os
+import sqlite3
+import sys
+import time
+from typing import Annotated, TypedDict
+
+from langchain_core.messages import AIMessage, AnyMessage, HumanMessage
+from langgraph.checkpoint.sqlite import SqliteSaver
+from langgraph.graph import END, StateGraph
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from agent_helpers import reduce_messages
+from checkpoint_helpers import DeltaSqliteSaver
+
+STEPS = 300
+MESSAGE = "The weather in San Francisco is foggy with a high of 62F. " * 8  # ~470 chars
+
+
+class AgentState(TypedDict):
+    messages: Annotated[list[AnyMessage], reduce_messages]
+
+
+def build_graph(checkpointer):
+    def llm(state: AgentState):
+        return {"messages": [AIMessage(content=MESSAGE)]}
+
+    graph = StateGraph(AgentState)
+    graph.add_node("llm", llm)
+    graph.add_conditional_edges("llm", lambda state: len(state["messages"]) <= STEPS, {True: "llm", False: END})
+    graph.set_entry_point("llm")
+    return graph.compile(checkpointer=checkpointer)
+
+
+class TimedPuts:
+    # wraps put() to time only the checkpoint writes
+    def __init__(self, saver):
+        self.seconds = 0.0
+        put = saver.put
+
+        def timed_put(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return put(*args, **kwargs)
+            finally:
+                self.seconds += time.perf_counter() - start
+        saver.put = timed_put
+
+
+def run(name, saver):
+    timer = TimedPuts(saver)
+    graph = build_graph(saver)
+    thread = {"configurable": {"thread_id": "1"}, "recursion_limit": STEPS + 10}
+    start = time.perf_counter()
+    graph.invoke({"messages": [HumanMessage(content="What is the weather in SF?")]}, thread)
+    total = time.perf_counter() - start
+    size, rows = saver.conn.execute("SELECT sum(length(checkpoint)), count(*) FROM checkpoints").fetchone()
+    start = time.perf_counter()
+    state = graph.get_state(thread)
+    get_state = time.perf_counter() - start
+    start = time.perf_counter()
+    history = list(graph.get_state_history(thread))
+    get_history = time.perf_counter() - start
+    print(f"{name:<24} {size / 1e6:8.2f} MB {timer.seconds / rows * 1e3:9.2f} ms {total:8.2f} s "
+          f"{get_state * 1e3:9.1f} ms {get_history:8.2f} s")
+    # ids are random uuids, compare the rest
+    return [(m.type, m.content) for m in state.values["messages"]], len(history)
+
+
+if __name__ == "__main__":
+    print(f"{STEPS} steps, ~{len(MESSAGE)} chars per message")
+    print(f"{'checkpointer':<24} {'stored':>11} {'put/step':>12} {'run':>10} {'get_state':>12} {'history':>10}")
+    full = run("SqliteSaver", SqliteSaver(sqlite3.connect(":memory:", check_same_thread=False)))
+    for every in [10, 50]:
+        delta = run(f"DeltaSqliteSaver({every})",
+                    DeltaSqliteSaver(sqlite3.connect(":memory:", check_same_thread=False), snapshot_every=every))
+        assert delta == full
@@ -0,0 +1,100 @@
+"""Time, peak memory and bytes read extracting the heading and paragraph text of
+weather pages (lesson 3): BeautifulSoup on the whole page, as lesson 3 did, vs
+extract_text parsing the page as it is read, with and without a character budget.
+
+The corpus is a directory of saved pages (*.html). Without one, weather-like
+pages of 40 kB to 2 MB (navigation, scripts, forecast, long comment sections)
+are generated into a temporary directory.
+
+    python benchmarks/bench_extract.py [pages_dir]
+"""
+import glob
+import os
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from scrape_helpers import extract_text
+
+CHUNK = 64 * 1024  # like PooledScraper's reads
+MAX_CHARS = 5000
+SIZES = [1, 2, 5, 10, 25, 50]  # forecast days per generated page
+
+
+def weather_page(n, days):
+    nav = "".join(f'<li><a href="/city/{i}">City {i}</a></li>' for i in range(200))
+    script = "<script>var config = {" + ", ".join(f'"k{i}": {i}' for i in range(1500)) + "};</script>"
+    forecast = "".join(
+        f"<section><h2>Day {d}, {h}:00</h2><p>Page {n}: partly cloudy, {50 + h}F, wind {h % 12} mph, "
+        f"humidity {40 + h}%. <b>UV</b> index {h % 9}.</p><div class='ad'><img src='/ad/{h}.png'></div></section>"
+        for d in range(days) for h in range(24))
+    comments = "".join(f"<div class='comment'><span>user{i}</span><p>Comment {i}: lovely day for a walk "
+                       f"along the bay, bring a jacket.</p></div>" for i in range(days * 200))
+    return (f"<html><head><title>Weather {n}</title>{script}<style>body {{ margin: 0 }}</style></head>"
+            f"<body><nav><ul>{nav}</ul></nav><h1>San Francisco, CA weather</h1>{forecast}"
+            f"<h3>Comments</h3>{comments}<footer>{nav}</footer></body></html>")
+
+
+def write_corpus(path):
+    for n, days in enumerate(SIZES * 2):
+        with open(os.path.join(path, f"weather-{n}.html"), "w", encoding="utf-8") as f:
+            f.write(weather_page(n, days))
+
+
+def chunks(path, counter):
+    # the page as it comes off the wire, counting the bytes read
+    with open(path, "rb") as f:
+        while chunk := f.read(CHUNK):
+            counter[0] += len(chunk)
+            yield chunk.decode("utf-8", errors="replace")
+
+
+def bs4_extract(path, counter):
+    # lesson 3's extraction: whole page, parsed tree, its headings and paragraphs
+    html = "".join(chunks(path, counter))
+    soup = BeautifulSoup(html, 'html.parser')
+    text = "\n".join(tag.get_text(" ", strip=True) for tag in soup.find_all(['h1', 'h2', 'h3', 'p']))
+    return re.sub(r'\s+', ' ', text)
+
+
+def run(name, extract, paths):
+    counter = [0]
+    start = time.perf_counter()
+    texts = [extract(path, counter) for path in paths]
+    seconds = time.perf_counter() - start
+    tracemalloc.start()  # again for the memory, it slows everything down
+    peak = 0
+    for path in paths:
+        tracemalloc.reset_peak()
+        extract(path, [0])
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+    tracemalloc.stop()
+    print(f"{name:<30} {seconds * 1e3 / len(paths):10.1f} ms {peak / 1e6:10.1f} MB {counter[0] / 1e6:9.1f} MB")
+    return texts
+
+
+def bench(path):
+    paths = sorted(glob.glob(os.path.join(path, "*.html")))
+    size = sum(os.path.getsize(p) for p in paths)
+    print(f"{len(paths)} pages, {size / 1e6:.1f} MB, {MAX_CHARS} chars budget")
+    print(f"{'extractor':<30} {'per page':>13} {'peak memory':>13} {'read':>12}")
+    before = run("BeautifulSoup, whole page", bs4_extract, paths)
+    after = run("extract_text, no budget", lambda p, c: extract_text(chunks(p, c)), paths)
+    assert before == after
+    budget = run(f"extract_text, {MAX_CHARS} chars",
+                 lambda p, c: extract_text(chunks(p, c), max_chars=MAX_CHARS), paths)
+    assert budget == [text[:MAX_CHARS] for text in before]
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        bench(sys.argv[1])
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            write_corpus(tmp)
+            bench(tmp)
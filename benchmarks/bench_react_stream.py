@@ -0,0 +1,147 @@
+"""Latency of lesson 1's ReAct loop (query) answering the two dogs question:
+blocking completions, parsed once complete, vs streamed ones whose action starts
+as soon as its line is complete, with and without cancelling the generation
+at PAUSE.
+
+The model is a local stub of the OpenAI chat completions API that writes a
+scripted ReAct response token by token at a fixed rate, going on after PAUSE
+with a made up observation like real models do. The actions take a fixed time,
+like a real tool call.
+
+    python benchmarks/bench_react_stream.py
+"""
+import json
+import os
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from openai import OpenAI
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from react_helpers import parse_action, stream_turn
+
+FIRST_TOKEN = 0.3  # s before the first token
+TOKEN = 0.02  # s per token after it
+ACTION_LATENCY = 0.2  # s per action
+
+# what the model says after 0, 1, 2, 3 observations
+SCRIPT = [
+    "Thought: I need the weight of each dog, starting with the border collie.\n"
+    "Action: average_dog_weight: Border Collie\nPAUSE\n\n"
+    "Observation: A Border Collie weighs 37 lbs\n\nThought: Now the scottish terrier.",
+    "Thought: Now I need the weight of the scottish terrier.\n"
+    "Action: average_dog_weight: Scottish Terrier\nPAUSE\n\n"
+    "Observation: Scottish Terriers average 20 lbs\n\nThought: I can add them up now.",
+    "Thought: I have both weights, I will add them.\nAction: calculate: 37 + 20\nPAUSE\n\n"
+    "Observation: 57\n\nAnswer: The combined weight of the two dogs is 57 lbs.",
+    "Answer: The combined weight of a border collie and a scottish terrier is 57 lbs.",
+]
+generated = []  # tokens sent per completion
+
+
+def tokens(text):
+    return re.findall(r"\s*\S+|\s+", text)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.0"  # the connection closes at the end of the stream
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        turn = sum(m["role"] == "user" and m["content"].startswith("Observation:") for m in body["messages"])
+        parts = tokens(SCRIPT[min(turn, len(SCRIPT) - 1)])
+        time.sleep(FIRST_TOKEN)
+        if not body.get("stream"):
+            time.sleep(TOKEN * len(parts))
+            generated.append(len(parts))
+            self.send_json({"id": "x", "object": "chat.completion", "created": 0, "model": body["model"],
+                            "choices": [{"index": 0, "finish_reason": "stop",
+                                         "message": {"role": "assistant", "content": "".join(parts)}}]})
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        sent = 0
+        try:
+            for part in parts:
+                chunk = {"id": "x", "object": "chat.completion.chunk", "created": 0, "model": body["model"],
+                         "choices": [{"index": 0, "delta": {"content": part}, "finish_reason": None}]}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                self.wfile.flush()
+                sent += 1
+                time.sleep(TOKEN)
+            self.wfile.write(b"data: [DONE]\n\n")
+        except (BrokenPipeError, ConnectionResetError):  # the client cancelled the generation
+            pass
+        generated.append(sent)
+
+    def send_json(self, data):
+        out = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(out)))
+        self.end_headers()
+        self.wfile.write(out)
+
+    def log_message(self, *args):
+        pass
+
+
+def average_dog_weight(name):
+    time.sleep(ACTION_LATENCY)
+    return {"Border Collie": "a Border Collies average weight is 37 lbs",
+            "Scottish Terrier": "Scottish Terriers average 20 lbs"}.get(name, "An average dog weights 50 lbs")
+
+
+def calculate(what):
+    time.sleep(ACTION_LATENCY)
+    return eval(what)
+
+
+ACTIONS = {"average_dog_weight": average_dog_weight, "calculate": calculate}
+
+
+def query(client, question, stream, stop_at_pause=True):
+    # lesson 1's query loop
+    messages = [{"role": "user", "content": question}]
+    while True:
+        if stream:
+            turn = stream_turn(client.chat.completions.create(model="gpt-3.5-turbo", messages=messages, stream=True),
+                               ACTIONS, stop_at_pause)
+            text, action = turn.text, turn.action
+        else:
+            completion = client.chat.completions.create(model="gpt-3.5-turbo", messages=messages)
+            text = completion.choices[0].message.content
+            action = parse_action(text)
+        messages.append({"role": "assistant", "content": text})
+        if not action:
+            return text
+        observation = turn.result.result() if stream else ACTIONS[action[0]](action[1])
+        messages.append({"role": "user", "content": f"Observation: {observation}"})
+
+
+def run(name, client, stream, stop_at_pause=True):
+    generated.clear()
+    start = time.perf_counter()
+    answer = query(client, "I have 2 dogs, a border collie and a scottish terrier. What is their combined weight",
+                   stream, stop_at_pause)
+    seconds = time.perf_counter() - start
+    print(f"{name:<36} {seconds:8.2f} s {seconds / len(generated):8.2f} s {sum(generated):10}")
+    return answer
+
+
+if __name__ == "__main__":
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = OpenAI(api_key="not-used", base_url=f"http://127.0.0.1:{server.server_port}/v1")
+    print(f"first token {FIRST_TOKEN * 1e3:.0f} ms, {TOKEN * 1e3:.0f} ms per token, actions {ACTION_LATENCY * 1e3:.0f} ms, "
+          f"4 turns")
+    print(f"{'completions':<36} {'total':>10} {'per turn':>10} {'tokens':>10}")
+    answers = [run("blocking, parsed once complete", client, stream=False),
+               run("streamed, action at its line", client, stream=True, stop_at_pause=False),
+               run("streamed, cancelled at PAUSE", client, stream=True)]
+    assert len(set(answers)) == 1, answers
+    server.shutdown()
@@ -0,0 +1,64 @@
+"""Micro-benchmark of the lesson 5 messages reducer: linear scan vs id index.
+
+Each graph step merges replaced messages (1, or 20 like a turn rewriting its
+tool calls) + one new message into the previous result, on threads of 10, 1k
+and 10k messages. Both copy the list, O(n) per step; the index is built once
+per step, the scan runs once per message of the step.
+
+    python benchmarks/bench_reduce_messages.py
+"""
+import os
+import sys
+import timeit
+from uuid import uuid4
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from agent_helpers import reduce_messages
+
+
+def reduce_messages_scan(left, right):
+    # the previous lesson 5 reducer, kept here as the baseline
+    for message in right:
+        if not message.id:
+            message.id = str(uuid4())
+    merged = left.copy()
+    for message in right:
+        for i, existing in enumerate(merged):
+            if existing.id == message.id:
+                merged[i] = message
+                break
+        else:
+            merged.append(message)
+    return merged
+
+
+def thread_of(n):
+    return [HumanMessage(content=f"message {i}", id=str(uuid4())) for i in range(n)]
+
+
+def run_steps(reducer, messages, steps, edits=1):
+    middle = len(messages) // 2
+    edited_ids = [m.id for m in messages[middle:middle + edits]]
+    for _ in range(steps):
+        # replace messages in the middle and append a new one, like a graph step would
+        messages = reducer(messages, [AIMessage(content="edited", id=edited_id) for edited_id in edited_ids]
+                           + [AIMessage(content="new", id=str(uuid4()))])
+    return messages
+
+
+if __name__ == "__main__":
+    print(f"{'messages':>9} {'edits':>6} {'scan (us/step)':>15} {'index (us/step)':>16} {'speedup':>8}")
+    for n in [10, 1_000, 10_000]:
+        for edits in [1, 20]:
+            steps = 200
+            start = thread_of(n)
+            scan_result = run_steps(reduce_messages_scan, start, 3, edits)
+            index_result = run_steps(reduce_messages, start, 3, edits)
+            assert [(m.id, m.content) for m in scan_result[:n]] == [(m.id, m.content) for m in index_result[:n]]
+            scan = min(timeit.repeat(lambda: run_steps(reduce_messages_scan, start, steps, edits),
+                                     number=1, repeat=3)) / steps
+            index = min(timeit.repeat(lambda: run_steps(reduce_messages, start, steps, edits),
+                                      number=1, repeat=3)) / steps
+            print(f"{n:>9} {edits:>6} {scan * 1e6:>15.1f} {index * 1e6:>16.1f} {scan / index:>7.1f}x")
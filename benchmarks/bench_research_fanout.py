@@ -0,0 +1,79 @@
+"""Wall-clock time per research step, sequential Tavily searches vs concurrent fan-out.
+
+Runs against a local stub of the Tavily /search endpoint that answers after a fixed
+latency, so no API key or network is needed.
+
+    python benchmarks/bench_research_fanout.py
+"""
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from search_helpers import PooledTavilyClient, research_content
+
+LATENCY = 0.25  # seconds per search round trip
+REPEATS = 5
+
+
+class StubTavilyHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+
+    def do_POST(self):
+        data = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        time.sleep(LATENCY)
+        body = json.dumps({"query": data["query"], "results": [
+            {"url": f"http://stub/{data['query']}/{i}", "content": f"{data['query']} result {i}"}
+            for i in range(data["max_results"])
+        ]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def sequential_research(base_url, queries):
+    # what the research nodes did before: one requests.post per query, one after another
+    content = []
+    for q in queries:
+        response = requests.post(f"{base_url}/search", json={"query": q, "max_results": 2}).json()
+        for r in response['results']:
+            content.append(r['content'])
+    return content
+
+
+def timeit(fn):
+    best = float("inf")
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+if __name__ == "__main__":
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubTavilyHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    client = PooledTavilyClient(api_key="stub", base_url=base_url)
+
+    print(f"stub search latency: {LATENCY * 1000:.0f} ms, best of {REPEATS}")
+    for step, n in [("research_plan", 3), ("research_critique", 2)]:
+        queries = [f"{step} query {i}" for i in range(n)]
+        before, expected = timeit(lambda: sequential_research(base_url, queries))
+        after, content = timeit(lambda: research_content(client, queries, max_results=2))
+        assert content == expected  # same content, same order
+        print(f"{step:<18} {n} queries  sequential {before * 1000:7.1f} ms  "
+              f"concurrent {after * 1000:7.1f} ms  ({before / after:.1f}x)")
+
+    client.close()
+    server.shutdown()
@@ -0,0 +1,123 @@
+"""Pages per second scraping search results (lesson 3): one bare requests.get
+after another vs PooledScraper (keep-alive pool, concurrent, per-host limits).
+
+Runs against local fixture servers (one per "website") that serve weather-like
+pages after a fixed latency, so no network is needed. One of the pages is huge,
+the scraper stops reading it at max_bytes.
+
+    python benchmarks/bench_scrape.py
+"""
+import os
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from scrape_helpers import PooledScraper
+
+LATENCY = 0.15  # s before a page is sent, like a real round trip + server time
+HOSTS = 3
+PAGES_PER_HOST = 8
+HUGE_PAGE_BYTES = 8 * 1024 * 1024
+
+
+def weather_page(n):
+    # navigation, scripts and forecast headings/paragraphs, ~40 kB
+    nav = "".join(f'<li><a href="/city/{i}">City {i}</a></li>' for i in range(200))
+    script = "<script>var config = {" + ", ".join(f'"k{i}": {i}' for i in range(1500)) + "};</script>"
+    forecast = "".join(f"<h2>Hour {h}:00</h2><p>Page {n}: partly cloudy, {50 + h}F, wind {h % 12} mph, "
+                       f"humidity {40 + h}%.</p><div class='ad'>ad</div>" for h in range(24))
+    return (f"<html><head><title>Weather {n}</title>{script}</head><body><nav><ul>{nav}</ul></nav>"
+            f"<h1>San Francisco, CA weather</h1>{forecast}<footer>{nav}</footer></body></html>").encode()
+
+
+PAGE = weather_page(0)
+connections = 0
+connections_lock = threading.Lock()
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+
+    def setup(self):
+        global connections
+        with connections_lock:
+            connections += 1
+        super().setup()
+
+    def do_GET(self):
+        time.sleep(LATENCY)
+        body = PAGE if self.path != "/huge" else b"<p>" + b"x" * HUGE_PAGE_BYTES + b"</p>"
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except ConnectionResetError:  # the scraper stopped reading at max_bytes
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+def extract(html):
+    # lesson 3's extraction
+    soup = BeautifulSoup(html, 'html.parser')
+    text = "\n".join(tag.get_text(" ", strip=True) for tag in soup.find_all(['h1', 'h2', 'h3', 'p']))
+    return re.sub(r'\s+', ' ', text)
+
+
+def sequential(urls):
+    # what lesson 3 did, for every url: new connection, whole body, then parse
+    pages = []
+    for url in urls:
+        response = requests.get(url, headers={'User-Agent': 'Mozilla/5.0'})
+        pages.append(extract(response.text))
+    return pages
+
+
+def pooled(scraper, urls):
+    return [page.value for page in scraper.scrape_all(urls, extract, max_workers=12)]
+
+
+def run(name, fn, urls):
+    global connections
+    connections = 0
+    start = time.perf_counter()
+    pages = fn(urls)
+    seconds = time.perf_counter() - start
+    print(f"{name:<34} {len(urls) / seconds:10.1f} {seconds:8.2f} s {connections:12}")
+    return pages
+
+
+if __name__ == "__main__":
+    servers = []
+    for _ in range(HOSTS):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), FixtureHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+    urls = [f"http://127.0.0.1:{s.server_port}/weather/{i}" for i in range(PAGES_PER_HOST) for s in servers]
+    scraper = PooledScraper(per_host=4, max_bytes=2 * 1024 * 1024)
+
+    print(f"{len(urls)} pages of {len(PAGE) / 1e3:.0f} kB on {HOSTS} hosts, {LATENCY * 1e3:.0f} ms latency")
+    print(f"{'scraper':<34} {'pages/s':>10} {'total':>10} {'connections':>12}")
+    before = run("requests.get, one after another", sequential, urls)
+    after = run("PooledScraper, 4 per host", lambda urls: pooled(scraper, urls), urls)
+    assert sorted(before) == sorted(after)
+    run("PooledScraper again (warm pool)", lambda urls: pooled(scraper, urls), urls)
+
+    huge = [f"http://127.0.0.1:{servers[0].server_port}/huge"]
+    run(f"requests.get, {HUGE_PAGE_BYTES >> 20} MB page", sequential, huge)
+    page = next(scraper.scrape_all(huge, extract))
+    print(f"{'PooledScraper, same page':<34} read {page.size >> 20} MB, truncated={page.truncated}, "
+          f"{page.elapsed:.2f} s")
+
+    scraper.close()
+    for server in servers:
+        server.shutdown()
@@ -0,0 +1,76 @@
+"""Latency of lesson 3's searches while DuckDuckGo rate limits: try DDG on every
+search and fall back to Tavily, vs FallbackSearch whose circuit breaker skips
+DDG after 3 failures in a row. Then DDG recovers (the breaker's half open probe
+closes it again) and finally every provider is down (the stale cache answers).
+
+The providers are local fakes with a fixed latency, no network needed.
+
+    python benchmarks/bench_search_fallback.py
+"""
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from search_helpers import CircuitBreaker, FallbackSearch, SearchBackend, SearchCache
+
+SEARCHES = 30
+DDG_FAIL_LATENCY = 0.3  # s before DDG answers 202 Ratelimit
+DDG_LATENCY = 0.05
+TAVILY_LATENCY = 0.1
+
+
+class FakeProvider:
+    def __init__(self, latency, fail_latency=None):
+        self.latency = latency
+        self.fail_latency = fail_latency
+        self.down = False
+
+    def __call__(self, query, max_results):
+        if self.down:
+            time.sleep(self.fail_latency)
+            raise RuntimeError("202 Ratelimit")
+        time.sleep(self.latency)
+        return [{"url": f"https://example.com/{query}/{i}", "title": query, "content": ""} for i in range(max_results)]
+
+
+def make(failures):
+    ddg = FakeProvider(DDG_LATENCY, DDG_FAIL_LATENCY)
+    tavily = FakeProvider(TAVILY_LATENCY, TAVILY_LATENCY)
+    searcher = FallbackSearch([SearchBackend("ddg", ddg, CircuitBreaker(failures=failures, timeout=1.0)),
+                               SearchBackend("tavily", tavily, CircuitBreaker(failures=failures, timeout=1.0))],
+                              cache=SearchCache(ttl=0))  # fresh results never reused, stale ones are
+    return searcher, ddg, tavily
+
+
+def run(name, searcher, queries):
+    latencies, sources = [], []
+    for query in queries:
+        start = time.perf_counter()
+        searcher.search(query, max_results=6)
+        latencies.append(time.perf_counter() - start)
+        sources.append(searcher.last_source)
+    print(f"{name:<36} {statistics.mean(latencies) * 1e3:8.0f} ms {max(latencies) * 1e3:8.0f} ms  "
+          f"{', '.join(f'{s}: {sources.count(s)}' for s in dict.fromkeys(sources))}")
+
+
+if __name__ == "__main__":
+    queries = [f"weather {i}" for i in range(SEARCHES)]
+    print(f"{SEARCHES} searches, DDG rate limited (fails after {DDG_FAIL_LATENCY * 1e3:.0f} ms), "
+          f"Tavily {TAVILY_LATENCY * 1e3:.0f} ms")
+    print(f"{'':<36} {'mean':>11} {'max':>11}  answered by")
+    searcher, ddg, _ = make(failures=10 ** 9)
+    ddg.down = True
+    run("DDG tried every time, no breaker", searcher, queries)
+
+    searcher, ddg, tavily = make(failures=3)
+    ddg.down = True
+    run("FallbackSearch, breaker", searcher, queries)
+    print("ddg:", searcher.metrics()["backends"]["ddg"])
+    ddg.down = False
+    time.sleep(1.0)  # the breaker half opens
+    run("DDG back, after the breaker timeout", searcher, queries)
+    ddg.down = tavily.down = True
+    run("every provider down", searcher, queries)
+    print("ddg:", searcher.metrics()["backends"]["ddg"])
@@ -0,0 +1,108 @@
+"""Arithmetic for the calculate action of the agent from scratch (lesson 1)."""
+import ast
+import math
+import operator
+from functools import lru_cache
+
+MAX_LENGTH = 1000  # characters of an expression
+MAX_STEPS = 200  # operations, calls and operands of an expression
+MAX_BITS = 4096  # size of any integer, operand or result (~1200 digits)
+
+_BINARY = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    ast.Pow: operator.pow,
+}
+_UNARY = {ast.UAdd: operator.pos, ast.USub: operator.neg}
+_FUNCTIONS = {"abs": abs, "round": round, "min": min, "max": max, "sqrt": math.sqrt}
+_NAMES = {"pi": math.pi, "e": math.e}
+
+
+class CalcError(ValueError):
+    """The expression isn't arithmetic, is over the budgets, or can't be computed."""
+
+
+def _check(value, max_bits):
+    if isinstance(value, int) and value.bit_length() > max_bits:
+        raise CalcError(f"number over {max_bits} bits")
+    return value
+
+
+def _binary(op, max_bits):
+    fn = _BINARY[op]
+
+    def apply(a, b):
+        # estimate the size of integer results before computing them (9**9**9 would take minutes)
+        if isinstance(a, int) and isinstance(b, int):
+            if op is ast.Pow and b > 0 and abs(a) > 1 and (b > max_bits or b * a.bit_length() > max_bits + b):
+                raise CalcError(f"number over {max_bits} bits")
+            if op is ast.Mult and a.bit_length() + b.bit_length() > max_bits + 1:
+                raise CalcError(f"number over {max_bits} bits")
+        try:
+            return _check(fn(a, b), max_bits)
+        except OverflowError:
+            raise CalcError("result too large") from None
+        except (ArithmeticError, TypeError) as e:  # division by zero, complex results...
+            raise CalcError(str(e)) from None
+    return apply
+
+
+def _compile(node, max_bits, steps):
+    steps[0] -= 1
+    if steps[0] < 0:
+        raise CalcError(f"expression over {steps[1]} steps")
+    if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+        value = _check(node.value, max_bits)
+        return lambda: value
+    if isinstance(node, ast.Name) and node.id in _NAMES:
+        value = _NAMES[node.id]
+        return lambda: value
+    if isinstance(node, ast.BinOp) and type(node.op) in _BINARY:
+        apply = _binary(type(node.op), max_bits)
+        left, right = _compile(node.left, max_bits, steps), _compile(node.right, max_bits, steps)
+        return lambda: apply(left(), right())
+    if isinstance(node, ast.UnaryOp) and type(node.op) in _UNARY:
+        fn = _UNARY[type(node.op)]
+        operand = _compile(node.operand, max_bits, steps)
+        return lambda: fn(operand())
+    if (isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in _FUNCTIONS
+            and not node.keywords):
+        fn = _FUNCTIONS[node.func.id]
+        args = [_compile(arg, max_bits, steps) for arg in node.args]
+
+        def call():
+            try:
+                return _check(fn(*(arg() for arg in args)), max_bits)
+            except (ArithmeticError, TypeError, ValueError) as e:  # sqrt(-1), min(), round(1, 2, 3)...
+                raise CalcError(str(e)) from None
+        return call
+    raise CalcError(f"not arithmetic: {ast.dump(node)[:80]}")
+
+
+@lru_cache(maxsize=1024)
+def compile_expression(expression, max_steps=MAX_STEPS, max_bits=MAX_BITS):
+    """Function computing expression: numbers, + - * / // % **, parentheses, pi, e,
+    abs, round, min, max and sqrt, nothing else. Parsed and checked once per
+    expression (cached). An expression has no loops, so its steps are counted here:
+    more than max_steps nodes is refused before anything runs. Integers over
+    max_bits are refused as operands and as results, those that would be are not
+    computed. Raises CalcError."""
+    if len(expression) > MAX_LENGTH:
+        raise CalcError(f"expression over {MAX_LENGTH} characters")
+    try:
+        tree = ast.parse(expression.strip(), mode="eval")
+    except (SyntaxError, RecursionError) as e:
+        raise CalcError(f"not an expression: {e}") from None
+    try:
+        return _compile(tree.body, max_bits, [max_steps, max_steps])  # steps left, budget
+    except RecursionError:
+        raise CalcError("expression too deep") from None
+
+
+def evaluate(expression, max_steps=MAX_STEPS, max_bits=MAX_BITS):
+    """Value of an arithmetic expression (see compile_expression). Raises CalcError."""
+    return compile_expression(expression, max_steps, max_bits)()
@@ -0,0 +1,475 @@
+"""Checkpointers used by the persistence lessons (4, 5) and the essay writer (lesson 6)."""
+import copy
+import json
+import queue
+import sqlite3
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import contextmanager
+from hashlib import md5
+from typing import NamedTuple, Optional
+
+import aiosqlite
+from langgraph.checkpoint.aiosqlite import AsyncSqliteSaver
+from langgraph.checkpoint.base import CheckpointTuple
+from langgraph.checkpoint.sqlite import SqliteSaver, search_where
+from langgraph.errors import EmptyChannelError
+
+DELTA_KEY = "__list_delta__"
+
+
+def latest_thread_ts(saver, thread_id):
+    """thread_ts of the latest checkpoint of a thread, None if it has none.
+    Only reads the primary key of a SqliteSaver table, nothing is deserialized."""
+    with saver.cursor(transaction=False) as cur:
+        cur.execute("SELECT thread_ts FROM checkpoints WHERE thread_id = ? ORDER BY thread_ts DESC LIMIT 1",
+                    (str(thread_id),))
+        row = cur.fetchone()
+    return row[0] if row else None
+
+
+def checkpoint_config(saver, thread_id, thread_ts):
+    """Config to get_state / update_state from checkpoint thread_ts of a thread, None if
+    there is no such checkpoint. Only checks the primary key, nothing is deserialized."""
+    with saver.cursor(transaction=False) as cur:
+        cur.execute("SELECT 1 FROM checkpoints WHERE thread_id = ? AND thread_ts = ?",
+                    (str(thread_id), str(thread_ts)))
+        row = cur.fetchone()
+    if row is None:
+        return None
+    return {"configurable": {"thread_id": str(thread_id), "thread_ts": thread_ts}}
+
+
+class CheckpointSummary(NamedTuple):
+    """Light version of a StateSnapshot: only the projected channels."""
+    config: dict
+    parent_config: Optional[dict]
+    source: Optional[str]
+    step: Optional[int]
+    values: dict
+    next: tuple
+    created_at: Optional[str]
+    has_writes: bool
+
+
+_CHECKPOINT = "CAST(checkpoint AS TEXT)"
+
+
+def _projection(truncate):
+    # SQL returning the channel at path (a bound parameter, once per "?") as JSON text,
+    # strings cut to `truncate` chars, strings inside a list too, so the full text
+    # never leaves SQLite
+    if truncate is None:
+        return f"json_quote(json_extract({_CHECKPOINT}, ?))"
+    n = int(truncate)
+    return f"""CASE json_type({_CHECKPOINT}, ?)
+        WHEN 'text' THEN json_quote(substr(json_extract({_CHECKPOINT}, ?), 1, {n}))
+        WHEN 'array' THEN (SELECT json_group_array(CASE type WHEN 'text' THEN substr(value, 1, {n}) ELSE json(value) END)
+                           FROM json_each({_CHECKPOINT}, ?))
+        ELSE json_quote(json_extract({_CHECKPOINT}, ?)) END"""
+
+
+def list_checkpoint_summaries(graph, config, channels=("count", "lnode", "revision_number"),
+                              truncate=None, limit=None, before=None):
+    """Like graph.get_state_history(config), latest first, but without deserializing checkpoints.
+
+    SQLite's json functions read the projected `channels`, source/step of the metadata,
+    and the channel versions needed to work out `next`, straight from the stored JSON,
+    so channels that aren't asked for (research content, drafts, messages) are never
+    loaded in Python. truncate ({channel: chars}) cuts strings, and the strings of
+    list channels, in the query too. Paginate with limit and before (a config, like
+    get_state_history). Needs a SqliteSaver (or subclass) with the default JSON
+    serializer; list channels of a DeltaSqliteSaver come back as the stored deltas.
+    """
+    thread_id = str(config["configurable"]["thread_id"])
+    truncate = truncate or {}
+    projections = [_projection(truncate.get(name)) for name in channels]
+    query = f"""SELECT thread_ts, parent_ts,
+        json_extract(CAST(metadata AS TEXT), '$.source'), json_extract(CAST(metadata AS TEXT), '$.step'),
+        json_type(CAST(metadata AS TEXT), '$.writes') IS NOT NULL,
+        json_extract({_CHECKPOINT}, '$.ts'),
+        json_extract({_CHECKPOINT}, '$.channel_versions'),
+        json_extract({_CHECKPOINT}, '$.versions_seen'),
+        (SELECT json_group_array(key) FROM json_each({_CHECKPOINT}, '$.channel_values')),
+        {", ".join(projections) or "NULL"}
+        FROM checkpoints WHERE thread_id = ?"""
+    params = [f'$.channel_values."{name}"' for name, sql in zip(channels, projections)
+              for _ in range(sql.count("?"))] + [thread_id]
+    if before is not None:
+        query += " AND thread_ts < ?"
+        params.append(before["configurable"]["thread_ts"])
+    query += " ORDER BY thread_ts DESC"
+    if limit:
+        query += f" LIMIT {int(limit)}"
+    with graph.checkpointer.cursor(transaction=False) as cur:
+        rows = cur.execute(query, params).fetchall()
+    summaries = []
+    for thread_ts, parent_ts, source, step, has_writes, created_at, versions, seen, filled, *projected in rows:
+        versions, seen, filled = json.loads(versions or "{}"), json.loads(seen or "{}"), set(json.loads(filled))
+        summaries.append(CheckpointSummary(
+            {"configurable": {"thread_id": thread_id, "thread_ts": thread_ts}},
+            {"configurable": {"thread_id": thread_id, "thread_ts": parent_ts}} if parent_ts else None,
+            source,
+            step,
+            {name: json.loads(value) for name, value in zip(channels, projected) if name in filled},
+            _next_nodes(graph, versions, seen, filled),
+            created_at,
+            bool(has_writes),
+        ))
+    return summaries
+
+
+def _next_nodes(graph, versions, seen, filled):
+    # same rule as the pregel loop: a node runs next if one of its trigger channels
+    # has a value and a newer version than the one the node has seen
+    if not versions:
+        return ()
+    null_version = type(next(iter(versions.values())))()
+    return tuple(
+        name for name, node in graph.nodes.items()
+        if any(chan in filled and versions.get(chan, null_version) > seen.get(name, {}).get(chan, null_version)
+               for chan in node.triggers)
+    )
+
+
+class DeltaSqliteSaver(SqliteSaver):
+    """SqliteSaver that stores list channels (like `messages`) as a delta against
+    the parent checkpoint instead of the whole list.
+
+    A delta keeps the length of the prefix shared with the parent list plus the
+    new tail, so appends and replacements of the last messages store only those
+    messages. Every `snapshot_every` checkpoints of a chain a full snapshot is
+    written, so rebuilding a checkpoint reads at most that many rows. States are
+    rebuilt when read (get_state / get_state_history).
+
+    Like the other reducers of these lessons, this assumes list items are not
+    mutated in place once they are in the state (replace them instead).
+    """
+
+    def __init__(self, conn, *, serde=None, snapshot_every=20, max_recent=256, parent_wait=5.0):
+        super().__init__(conn, serde=serde)
+        self.snapshot_every = snapshot_every
+        self.max_recent = max_recent
+        self.parent_wait = parent_wait
+        # (thread_id, thread_ts) -> (channel_values, depth) of the last checkpoints put.
+        # The graph puts checkpoints in the background without waiting, so a
+        # checkpoint can arrive while its parent is still being written.
+        self._recent = OrderedDict()
+        self._recent_cond = threading.Condition()
+
+    @classmethod
+    def from_conn_string(cls, conn_string, **kwargs):
+        return cls(conn=sqlite3.connect(conn_string, check_same_thread=False), **kwargs)
+
+    # Writing
+    def _delta_values(self, parent_values, values):
+        stored = {}
+        for k, v in values.items():
+            old = parent_values.get(k)
+            if isinstance(v, list) and isinstance(old, list):
+                prefix = 0
+                for a, b in zip(old, v):
+                    if a is not b and a != b:
+                        break
+                    prefix += 1
+                stored[k] = {DELTA_KEY: [prefix, v[prefix:]]}
+            else:
+                stored[k] = v
+        return stored
+
+    def _parent(self, thread_id, parent_ts):
+        """(channel_values, depth) of the parent checkpoint, None to write a full snapshot."""
+        key = (thread_id, parent_ts)
+        with self._recent_cond:
+            if key in self._recent:
+                return self._recent[key]
+        # an older checkpoint (time travel, new process...) is read back from the table
+        parent = self._load(thread_id, parent_ts, {})
+        if parent is None:
+            # not written yet, its put is running in another thread
+            with self._recent_cond:
+                if self._recent_cond.wait_for(lambda: key in self._recent, timeout=self.parent_wait):
+                    parent = self._recent[key]
+        return parent
+
+    def put(self, config, checkpoint, metadata):
+        thread_id = str(config["configurable"]["thread_id"])
+        parent_ts = config["configurable"].get("thread_ts")
+        values = checkpoint["channel_values"]
+        parent = self._parent(thread_id, parent_ts) if parent_ts else None
+        if parent is None or parent[1] + 1 >= self.snapshot_every:
+            stored, depth = checkpoint, 0
+        else:
+            depth = parent[1] + 1
+            stored = {**checkpoint, "channel_values": self._delta_values(parent[0], values),
+                      "delta_depth": depth}
+        with self._recent_cond:
+            self._recent[(thread_id, checkpoint["id"])] = (values, depth)
+            while len(self._recent) > self.max_recent:
+                self._recent.popitem(last=False)
+            self._recent_cond.notify_all()
+        with self.lock, self.cursor() as cur:
+            cur.execute(
+                "INSERT OR REPLACE INTO checkpoints (thread_id, thread_ts, parent_ts, checkpoint, metadata) VALUES (?, ?, ?, ?, ?)",
+                (thread_id, checkpoint["id"], parent_ts, self.serde.dumps(stored), self.serde.dumps(metadata)),
+            )
+        return {"configurable": {"thread_id": config["configurable"]["thread_id"], "thread_ts": checkpoint["id"]}}
+
+    def get_next_version(self, current, channel):
+        # SqliteSaver hashes the whole serialized channel value on every update,
+        # for list channels the length and last item are enough to tell versions apart
+        if current is None:
+            current_v = 0
+        else:
+            current_v = int(current.split(".")[0])
+        try:
+            value = channel.checkpoint()
+            if isinstance(value, list):
+                value = [len(value), value[-1:]]
+            next_h = md5(self.serde.dumps(value)).hexdigest()
+        except EmptyChannelError:
+            next_h = ""
+        return f"{current_v + 1:032}.{next_h}"
+
+    # Reading
+    def _restore(self, thread_id, checkpoint, parent_ts, memo):
+        """Rebuilds the full checkpoint from a stored row, returns (checkpoint, depth)."""
+        depth = checkpoint.pop("delta_depth", 0)
+        if depth:
+            parent = self._load(thread_id, parent_ts, memo)
+            if parent is None:  # the parent row is still being written
+                with self._recent_cond:
+                    parent = self._recent.get((thread_id, parent_ts))
+            if parent is None:
+                raise ValueError(f"Checkpoint {checkpoint['id']} of thread {thread_id} is stored as a delta "
+                                 f"of checkpoint {parent_ts}, which is missing")
+            parent_values = parent[0]
+            values = {}
+            for k, v in checkpoint["channel_values"].items():
+                if isinstance(v, dict) and DELTA_KEY in v:
+                    prefix, tail = v[DELTA_KEY]
+                    v = parent_values[k][:prefix] + tail
+                values[k] = v
+            checkpoint["channel_values"] = values
+        memo[(thread_id, checkpoint["id"])] = (checkpoint["channel_values"], depth)
+        return checkpoint, depth
+
+    def _load(self, thread_id, thread_ts, memo):
+        """(channel_values, depth) of a stored checkpoint, None if missing.
+        memo: (thread_id, thread_ts) -> (channel_values, depth) of the checkpoints rebuilt."""
+        if (thread_id, thread_ts) in memo:
+            return memo[(thread_id, thread_ts)]
+        with self.cursor(transaction=False) as cur:
+            cur.execute("SELECT checkpoint, parent_ts FROM checkpoints WHERE thread_id = ? AND thread_ts = ?",
+                        (thread_id, str(thread_ts)))
+            row = cur.fetchone()
+        if row is None:
+            return None
+        checkpoint, depth = self._restore(thread_id, self.serde.loads(row[0]), row[1], memo)
+        return checkpoint["channel_values"], depth
+
+    def get_tuple(self, config):
+        saved = super().get_tuple(config)
+        if saved is None:
+            return None
+        thread_id = str(saved.config["configurable"]["thread_id"])
+        parent_ts = saved.parent_config["configurable"]["thread_ts"] if saved.parent_config else None
+        checkpoint, _ = self._restore(thread_id, saved.checkpoint, parent_ts, {})
+        return saved._replace(checkpoint=checkpoint)
+
+    def list(self, config, *, filter=None, before=None, limit=None):
+        # newest first: rebuilding one checkpoint also rebuilds (and memoizes) its
+        # parents, which are the next ones listed
+        memo = {}
+        where, param_values = search_where(config, filter, before)
+        query = f"""SELECT thread_id, thread_ts, parent_ts, checkpoint, metadata
+        FROM checkpoints
+        {where}
+        ORDER BY thread_ts DESC"""
+        if limit:
+            query += f" LIMIT {limit}"
+        with self.cursor(transaction=False) as cur:
+            rows = cur.execute(query, param_values).fetchall()
+        for thread_id, thread_ts, parent_ts, value, metadata in rows:
+            if (thread_id, thread_ts) in memo:
+                checkpoint = self.serde.loads(value)
+                checkpoint.pop("delta_depth", None)
+                checkpoint["channel_values"] = memo[(thread_id, thread_ts)][0]
+            else:
+                checkpoint, _ = self._restore(thread_id, self.serde.loads(value), parent_ts, memo)
+            # states listed together share their older messages, give each its own copies
+            checkpoint["channel_values"] = {
+                k: [copy.copy(item) for item in v] if isinstance(v, list) else v
+                for k, v in checkpoint["channel_values"].items()
+            }
+            yield CheckpointTuple(
+                {"configurable": {"thread_id": thread_id, "thread_ts": thread_ts}},
+                checkpoint,
+                self.serde.loads(metadata) if metadata is not None else {},
+                {"configurable": {"thread_id": thread_id, "thread_ts": parent_ts}} if parent_ts else None,
+            )
+
+
+class PooledSqliteSaver(SqliteSaver):
+    """File-backed SqliteSaver for serving many threads at once (the writer GUI).
+
+    The database runs in WAL mode so reads don't block the writer. Reads
+    (get_state, get_state_history) borrow a connection from a pool of `readers`
+    connections. Writes go through a queue to a single writer thread, which
+    commits them in batches of up to `batch_size` (one fsync for all the
+    checkpoints that arrived together). put() returns once its batch is committed,
+    so a get_state right after invoke sees the new checkpoint.
+    """
+
+    PRAGMAS = {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",  # with WAL, only the last transactions can be lost on power failure
+        "mmap_size": 256 * 1024 * 1024,
+        "cache_size": -64 * 1024,  # KiB
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,  # ms
+    }
+
+    def __init__(self, path, *, serde=None, readers=4, batch_size=64, pragmas=None):
+        if path == ":memory:" or not path:
+            raise ValueError("PooledSqliteSaver needs a database file, connections can't share :memory:")
+        self.path = path
+        self.pragmas = {**self.PRAGMAS, **(pragmas or {})}
+        super().__init__(self._connect(), serde=serde)
+        self.setup()
+        self.batch_size = batch_size
+        self._readers = queue.Queue()
+        for _ in range(readers):
+            self._readers.put(self._connect())
+        self._writes = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, name="checkpoint-writer", daemon=True)
+        self._writer.start()
+
+    @classmethod
+    def from_conn_string(cls, conn_string, **kwargs):
+        return cls(conn_string, **kwargs)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name}={value}")
+        return conn
+
+    @contextmanager
+    def cursor(self, transaction=True):
+        if transaction:  # only setup() and direct callers write through self.conn
+            with super().cursor(transaction) as cur:
+                yield cur
+            return
+        conn = self._readers.get()
+        cur = conn.cursor()
+        try:
+            yield cur
+        finally:
+            cur.close()
+            self._readers.put(conn)
+
+    # Writing
+    def _write_loop(self):
+        while True:
+            batch = [self._writes.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._writes.get_nowait())
+                except queue.Empty:
+                    break
+            rows = [item for item in batch if item is not None]
+            if rows:
+                try:
+                    with self.conn:  # one transaction for the whole batch
+                        self.conn.executemany(
+                            "INSERT OR REPLACE INTO checkpoints (thread_id, thread_ts, parent_ts, checkpoint, metadata) VALUES (?, ?, ?, ?, ?)",
+                            [row for row, _ in rows],
+                        )
+                except Exception as e:
+                    for _, done in rows:
+                        done.set_exception(e)
+                else:
+                    for _, done in rows:
+                        done.set_result(None)
+            if len(rows) < len(batch):  # None: close() was called
+                return
+
+    def put(self, config, checkpoint, metadata):
+        row = (
+            str(config["configurable"]["thread_id"]),
+            checkpoint["id"],
+            config["configurable"].get("thread_ts"),
+            self.serde.dumps(checkpoint),
+            self.serde.dumps(metadata),
+        )
+        done = Future()
+        self._writes.put((row, done))
+        done.result()
+        return {"configurable": {"thread_id": config["configurable"]["thread_id"], "thread_ts": checkpoint["id"]}}
+
+    def thread_ids(self):
+        """Ids of all the threads with checkpoints, e.g. to resume after a restart."""
+        with self.cursor(transaction=False) as cur:
+            return [row[0] for row in cur.execute("SELECT DISTINCT thread_id FROM checkpoints")]
+
+    def close(self):
+        self._writes.put(None)
+        self._writer.join()
+        while not self._readers.empty():
+            self._readers.get().close()
+        self.conn.close()
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class AsyncPooledSqliteSaver(AsyncSqliteSaver):
+    """AsyncSqliteSaver on a database file, for running graphs with ainvoke/astream
+    on one event loop (the async essay writer GUI).
+
+    Graph runs use the async methods (aiosqlite). The sync methods, which
+    AsyncSqliteSaver doesn't implement, go to a PooledSqliteSaver on the same file,
+    so the quick reads of the GUI (get_state, update_state, the checkpoint
+    summaries) keep working. Both run in WAL mode with the same pragmas.
+    """
+
+    def __init__(self, path, *, serde=None, readers=4, batch_size=64, pragmas=None):
+        self.sync = PooledSqliteSaver(path, serde=serde, readers=readers, batch_size=batch_size, pragmas=pragmas)
+        super().__init__(aiosqlite.connect(path), serde=serde)
+
+    @classmethod
+    def from_conn_string(cls, conn_string, **kwargs):
+        return cls(conn_string, **kwargs)
+
+    async def setup(self):
+        # the table was created by the sync saver, only the connection needs the pragmas
+        async with self.lock:
+            if self.is_setup:
+                return
+            if not self.conn.is_alive():
+                await self.conn
+            for name, value in self.sync.pragmas.items():
+                await self.conn.execute(f"PRAGMA {name}={value}")
+            self.is_setup = True
+
+    def get_tuple(self, config):
+        return self.sync.get_tuple(config)
+
+    def list(self, config, *, filter=None, before=None, limit=None):
+        return self.sync.list(config, filter=filter, before=before, limit=limit)
+
+    def put(self, config, checkpoint, metadata):
+        return self.sync.put(config, checkpoint, metadata)
+
+    def cursor(self, transaction=True):
+        return self.sync.cursor(transaction)
+
+    def thread_ids(self):
+        return self.sync.thread_ids()
+
+    async def aclose(self):
+        if self.is_setup:
+            await self.conn.close()
+        self.sync.close()
@@ -0,0 +1,120 @@
+"""Choosing what goes into the prompts of the essay writer (lesson 6)."""
+import math
+import re
+from collections import Counter
+from functools import lru_cache
+from typing import NamedTuple
+
+_WORD = re.compile(r"\w+")
+
+
+# Token counting
+@lru_cache(maxsize=None)
+def _encoding(model):
+    try:
+        import tiktoken
+        return tiktoken.encoding_for_model(model)
+    except Exception:  # not installed, or its BPE file can't be downloaded (offline)
+        return None
+
+
+def count_tokens(text, model="gpt-3.5-turbo"):
+    """Tokens of text for model, with tiktoken. Without it, an estimate of 4 characters per token."""
+    encoding = _encoding(model)
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text))
+
+
+# Near duplicates
+def _words(text):
+    return _WORD.findall(text.lower())
+
+
+def _shingles(words, n=3):
+    return {tuple(words[i:i + n]) for i in range(max(1, len(words) - n + 1))}
+
+
+def dedupe(items, threshold=0.8):
+    """Indexes of the items to keep: the first of each group of near duplicates
+    (same words, or word 3-grams with Jaccard similarity >= threshold)."""
+    kept, seen, shingles = [], set(), []
+    for i, item in enumerate(items):
+        words = _words(item)
+        key = " ".join(words)
+        if key in seen:
+            continue
+        s = _shingles(words)
+        if any(len(s & other) >= threshold * len(s | other) for other in shingles):
+            continue
+        seen.add(key)
+        shingles.append(s)
+        kept.append(i)
+    return kept
+
+
+# Ranking
+def bm25_scores(query, docs, k1=1.5, b=0.75):
+    """BM25 score of each of docs (strings) for query, with the docs as the corpus."""
+    tokenized = [_words(doc) for doc in docs]
+    if not tokenized:
+        return []
+    avg_len = sum(len(words) for words in tokenized) / len(tokenized) or 1
+    df = Counter(term for words in tokenized for term in set(words))
+    n = len(tokenized)
+    terms = set(_words(query))
+    scores = []
+    for words in tokenized:
+        tf = Counter(words)
+        score = 0.0
+        for term in terms:
+            if term not in tf:
+                continue
+            idf = math.log(1 + (n - df[term] + 0.5) / (df[term] + 0.5))
+            score += idf * tf[term] * (k1 + 1) / (tf[term] + k1 * (1 - b + b * len(words) / avg_len))
+        scores.append(score)
+    return scores
+
+
+# Selection
+class ContentSelection(NamedTuple):
+    items: list  # selected snippets, in research order
+    tokens: int  # tokens of the selected snippets, joined
+    total_tokens: int  # tokens of all the content joined, what the prompt had before
+    total_items: int
+    duplicates: int  # near duplicates dropped
+
+    def report(self):
+        saved = self.total_tokens - self.tokens
+        return (f"content: {len(self.items)}/{self.total_items} snippets, {self.tokens}/{self.total_tokens} tokens "
+                f"({saved} saved, {self.duplicates} duplicates)")
+
+
+def select_content(content, query, token_budget=1500, top_k=None, threshold=0.8, separator="\n\n",
+                   model="gpt-3.5-turbo"):
+    """Research snippets to put in a prompt: near duplicates dropped, the rest ranked
+    by BM25 relevance to query (e.g. task + critique), then the best ones packed
+    until token_budget (None: no limit) or top_k items. Snippets keep their research
+    order in the prompt."""
+    content = list(content or [])
+    kept = dedupe(content, threshold)
+    scores = bm25_scores(query, [content[i] for i in kept])
+    ranked = sorted(zip(kept, scores), key=lambda pair: (-pair[1], pair[0]))
+    separator_tokens = count_tokens(separator, model)
+    chosen, used = [], 0
+    for i, _ in ranked:
+        if top_k is not None and len(chosen) >= top_k:
+            break
+        cost = count_tokens(content[i], model) + (separator_tokens if chosen else 0)
+        if token_budget is not None and used + cost > token_budget:
+            continue  # a shorter one may still fit
+        chosen.append(i)
+        used += cost
+    items = [content[i] for i in sorted(chosen)]
+    return ContentSelection(
+        items,
+        count_tokens(separator.join(items), model),
+        count_tokens(separator.join(content), model),
+        len(content),
+        len(content) - len(kept),
+    )
@@ -6,15 +6,26 @@ from dotenv import load_dotenv
 
 _ = load_dotenv()
 from openai import OpenAI
+from calc_helpers import CalcError, evaluate
+from react_helpers import ConversationMemory, parse_action, stream_turn
 
 client = OpenAI()
 
 class Agent:
-    def __init__(self, system_message=""):
+    def __init__(self, system_message="", stream=False, actions=None, stop_at_pause=True, token_budget=None):
         self.system_message = system_message
-        self.messages = []
-        if self.system_message:
-            self.messages.append({"role": "system", "content": system_message})
+        # The whole conversation is in self.messages. What's sent is memory.next_request(): with
+        # a token_budget, the older turns are summarized once the messages are over it (None: all of
+        # them are sent every time). memory.reports has the tokens of each request.
+        self.memory = ConversationMemory(system_message, token_budget)
+        self.messages = self.memory.transcript
+        # Streaming mode: the response is read while it's generated, its action (one of actions)
+        # starts as soon as the Action line is complete and, with stop_at_pause, the rest of the
+        # generation is cancelled at PAUSE. self.turn tells what happened in the last call.
+        self.stream = stream
+        self.actions = actions or {}
+        self.stop_at_pause = stop_at_pause
+        self.turn = None
 
     def __call__(self, message):
         self.messages.append({"role": "user", "content": message})
@@ -23,10 +34,18 @@ class Agent:
         return result
 
     def execute(self):
+        if self.stream:
+            stream = client.chat.completions.create(
+                        model="gpt-3.5-turbo",
+                        temperature=0,
+                        messages=self.memory.next_request(),
+                        stream=True)
+            self.turn = stream_turn(stream, self.actions, self.stop_at_pause)
+            return self.turn.text
         completion = client.chat.completions.create(
                         model="gpt-3.5-turbo",
                         temperature=0,
-                        messages=self.messages)
+                        messages=self.memory.next_request())
         return completion.choices[0].message.content
 
 #ReAct pattern, specific format for system message
@@ -65,8 +84,13 @@ Answer: A bulldog weights 51 lbs
 
 
 # Tools
+# Arithmetic only (eval ran any Python the model wrote), each expression parsed once,
+# with limits on its size and on the numbers, so 9**9**9 is an error instead of a hang.
 def calculate(what):
-    return eval(what)
+    try:
+        return evaluate(what)
+    except CalcError as e:
+        return f"Error: {e}. calculate only takes arithmetic, e.g. 4 * 7 / 3"
 
 def average_dog_weight(name):
     if name in "Scottish Terrier":
@@ -110,7 +134,7 @@ abot(next_prompt)
 next_prompt = "Observation: {}".format(average_dog_weight("Scottish Terrier"))
 print(next_prompt)
 abot(next_prompt)
-next_prompt = "Observation: {}".format(eval("37 + 20"))
+next_prompt = "Observation: {}".format(calculate("37 + 20"))
 print(next_prompt)
 abot(next_prompt)
 print(abot.messages)
@@ -120,34 +144,42 @@ print("=" * 50)
 print("\nExample with Agent in loop running functions.\n")
 print("=" * 50)
 
- # Python regular expression to selection action
-action_re = re.compile('^Action: (\w+): (.*)$')
+ # Python regular expression to selection action, parse_action uses it on the
+ # whole response at once, stopping at the first Action line
+action_re = re.compile(r'^Action: (\w+): (.*)$', re.MULTILINE)
 
 # Implementing a loop
-def query(question, max_turns=5):
+# stream: the action starts while the response is generated, which stops at PAUSE
+# token_budget: older turns are summarized once the messages are over it
+def query(question, max_turns=5, stream=False, token_budget=None):
     i = 0
-    bot = Agent(prompt)
+    bot = Agent(prompt, stream=stream, actions=known_actions, token_budget=token_budget)
     next_prompt = question
     while i < max_turns:
         i += 1
         result = bot(next_prompt)
         print(result)
-        actions = [
-            action_re.match(a) 
-            for a in result.split('\n') 
-            if action_re.match(a)
-        ]
-        if actions:
+        if token_budget is not None:
+            print(bot.memory.last.report())
+        action = bot.turn.action if stream else parse_action(result, action_re)
+        if action:
             # There is an action to run
-            action, action_input = actions[0].groups()
+            action, action_input = action
             if action not in known_actions:
                 raise Exception("Unknown action: {}: {}".format(action, action_input))
             print(" -- running {} {}".format(action, action_input))
-            observation = known_actions[action](action_input)
+            if stream:
+                observation = bot.turn.result.result() # already running
+            else:
+                observation = known_actions[action](action_input)
             print("Observation:", observation)
             next_prompt = "Observation: {}".format(observation)
         else:
             return
 
 question = """I have 2 dogs, a border collie and a scottish terrier. What is their combined weight"""
-query(question)
\ No newline at end of file
+# REACT_STREAM=1 streams the completions: each action starts as soon as its line is complete and the
+# generation stops at PAUSE (benchmarks/bench_react_stream.py compares both)
+# REACT_TOKEN_BUDGET=300 summarizes the earlier turns once the messages are over 300 tokens and prints
+# the tokens sent each turn (benchmarks/bench_agent_memory.py shows a long loop)
+query(question, stream=bool(os.getenv("REACT_STREAM")), token_budget=int(os.getenv("REACT_TOKEN_BUDGET", 0)) or None)
\ No newline at end of file
@@ -4,65 +4,80 @@ _ = load_dotenv()
 from langgraph.graph import StateGraph, END
 from typing import TypedDict, Annotated
 import operator
-from langchain_core.messages import AnyMessage, SystemMessage, HumanMessage, ToolMessage
+from langchain_core.messages import AnyMessage, HumanMessage
 from langchain_openai import ChatOpenAI
-from langchain_community.tools.tavily_search import TavilySearchResults
+from agent_helpers import run_tool_calls, arun_tool_calls, CachedTavilySearchResults, BoundGraph, agent_node, graphs
+from agent_helpers import AgentPrompt
+from search_helpers import SearchCache
 
-tool = TavilySearchResults(max_results=4)
+# Repeated queries (same question asked again, other model...) are answered from the cache.
+tool = CachedTavilySearchResults(max_results=4, cache=SearchCache())
 #print(type(tool))
 #print(tool.name)
 
 class AgentState(TypedDict):
     messages: Annotated[list[AnyMessage], operator.add]
 
+# Represents decision node.
+def exists_action(state: AgentState):
+    result = state['messages'][-1]
+    return len(result.tool_calls) > 0
+
+# Set up graph
+# The nodes call the methods of the agent found in the config, so the graph doesn't depend
+# on the Agent: it is built and compiled once and every Agent uses it.
+def build_graph():
+    graph = StateGraph(AgentState)
+    graph.add_node("llm", agent_node("call_openai"))
+    graph.add_node("action", agent_node("take_action", "atake_action"))
+    graph.add_conditional_edges(
+        "llm",
+        exists_action,
+        {True: "action", False: END}
+    )
+    graph.add_edge("action", "llm")
+    graph.set_entry_point("llm")
+    return graph
+
 class Agent:
 
-    def __init__(self, model, tools, system=""):
+    def __init__(self, model, tools, system="", max_concurrency=4, tool_timeout=None):
         self.system = system
+        self.max_concurrency = max_concurrency # Max tool calls running at the same time.
+        self.tool_timeout = tool_timeout # Seconds, a number or a {tool_name: seconds} dict.
 
-        # Set up graph
-        graph = StateGraph(AgentState)
-        graph.add_node("llm", self.call_openai)
-        graph.add_node("action", self.take_action)
-        graph.add_conditional_edges(
-            "llm",
-            self.exists_action,
-            {True: "action", False: END}
-        )
-        graph.add_edge("action", "llm")
-        graph.set_entry_point("llm")
-        self.graph = graph.compile() # Turn graph setup into a Langchain runnable.
-        # Exposes an standard interface for calling and invoking this graph.
+        # The compiled graph (a Langchain runnable, exposes an standard interface for calling
+        # and invoking this graph), with this agent added to the config of every call.
+        self.graph = BoundGraph(graphs.graph(("agent", AgentState), build_graph), {"agent": self})
 
         # Tools
         self.tools = {t.name: t for t in tools}
-        self.model = model.bind_tools(tools) # Letting the model know that it has these tools available to call.
-
-    # Represents decision node.
-    def exists_action(self, state: AgentState):
-        result = state['messages'][-1]
-        return len(result.tool_calls) > 0
+        # Letting the model know that it has these tools available to call, once per model and tools.
+        # The system message is made once too.
+        self.prompt = AgentPrompt(system)
+        self.model = graphs.bound_model(model, tools)
 
     # Represents LLM node.
-    def call_openai(self, state: AgentState):
-        messages = state['messages']
-        if self.system:
-            messages = [SystemMessage(content=self.system)] + messages
-        message = self.model.invoke(messages)
+    # A model can also be given when invoking the graph: {"configurable": {"model": ...}}
+    def call_openai(self, state: AgentState, config):
+        model = config["configurable"].get("model")
+        model = graphs.bound_model(model, self.tools.values()) if model else self.model
+        message = model.invoke(self.prompt.messages(state['messages']))
         return {'messages': [message]}
 
     # Represents action node.
+    # Tool calls run concurrently (thread pool), results keep the tool_call order.
+    # Bad tool names from the LLM get a "bad tool name, retry" message.
     def take_action(self, state: AgentState):
         tool_calls = state['messages'][-1].tool_calls
-        results = []
-        for t in tool_calls:
-            print(f"Calling: {t}")
-            if not t['name'] in self.tools:      # check for bad tool name from LLM
-                print("\n ....bad tool name....")
-                result = "bad tool name, retry"  # instruct LLM to retry if bad
-            else:
-                result = self.tools[t['name']].invoke(t['args'])
-            results.append(ToolMessage(tool_call_id=t['id'], name=t['name'], content=str(result)))
+        results = run_tool_calls(self.tools, tool_calls, self.max_concurrency, self.tool_timeout)
+        print("Back to the model!")
+        return {'messages': results}
+
+    # Same as take_action when the graph runs async (ainvoke, astream...), uses tool.ainvoke.
+    async def atake_action(self, state: AgentState):
+        tool_calls = state['messages'][-1].tool_calls
+        results = await arun_tool_calls(self.tools, tool_calls, self.max_concurrency, self.tool_timeout)
         print("Back to the model!")
         return {'messages': results}
     
@@ -98,7 +113,6 @@ query = "Who won the super bowl in 2024? In what state is the winning team headq
 What is the GDP of that state? Answer each question." 
 messages = [HumanMessage(content=query)]
 
-model = ChatOpenAI(model="gpt-4o")
-abot = Agent(model, [tool], system=prompt)
-result = abot.graph.invoke({"messages": messages})
+# Same agent and graph, other model
+result = abot.graph.invoke({"messages": messages}, {"configurable": {"model": ChatOpenAI(model="gpt-4o")}})
 print(result['messages'][-1].content)
\ No newline at end of file
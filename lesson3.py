@@ -6,11 +6,16 @@ from tavily import TavilyClient
 # load environment variables from .env file
 _ = load_dotenv()
 
+from search_helpers import CachedSearch, FallbackSearch, SearchCache, ddg_backend, tavily_backend
+
+# search results are cached (in memory + sqlite file), re-running the lesson doesn't repeat the searches
+search_cache = SearchCache(path="search_cache.sqlite")
+
 # connect
-client = TavilyClient(api_key=os.environ.get("TAVILY_API_KEY"))
+client = CachedSearch(TavilyClient(api_key=os.environ.get("TAVILY_API_KEY")), search_cache)
 
 # run search
-result = client.search("What is in Nvidia's new Blackwell GPU?",
+result = client.search(query="What is in Nvidia's new Blackwell GPU?",
                        include_answer=True)
 # print the answer
 result["answer"]
@@ -28,67 +33,49 @@ query = f"""
     "weather.com"
 """
 
-import requests
-from bs4 import BeautifulSoup
 from duckduckgo_search import DDGS
-import re
+from scrape_helpers import PooledScraper, extract_text
 
 ddg = DDGS()
 
+# DuckDuckGo first, Tavily if it fails (e.g. DDG rate limits due to high deeplearning.ai volume),
+# then the last results found for the query. A provider that failed 3 times in a row is skipped
+# for 30 s (doubling while it keeps failing) instead of slowing down every search.
+searcher = FallbackSearch([ddg_backend(ddg, failures=3, timeout=30),
+                           tavily_backend(client.client, failures=3, timeout=30)],
+                          cache=search_cache)
+
 def search(query, max_results=6):
-    try:
-        results = ddg.text(query, max_results=max_results)
-        return [i["href"] for i in results]
-    except Exception as e:
-        print(f"returning previous results due to exception reaching ddg.")
-        results = [ # cover case where DDG rate limits due to high deeplearning.ai volume
-            "https://weather.com/weather/today/l/USCA0987:1:US",
-            "https://weather.com/weather/hourbyhour/l/54f9d8baac32496f6b5497b4bf7a277c3e2e6cc5625de69680e6169e7e38e9a8",
-        ]
-        return results  
+    results = searcher.search(query, max_results=max_results)
+    if searcher.last_source != "ddg":
+        print(f"results from {searcher.last_source or 'nowhere, all search providers failed'}")
+    return [i["url"] for i in results]
 
 
 for i in search(query):
     print(i)
+print(searcher.metrics())
 
-def scrape_weather_info(url):
-    """Scrape content from the given URL"""
-    if not url:
-        return "Weather information could not be found."
-    
-    # fetch data
-    headers = {'User-Agent': 'Mozilla/5.0'}
-    response = requests.get(url, headers=headers)
-    if response.status_code != 200:
-        return "Failed to retrieve the webpage."
-
-    # parse result
-    soup = BeautifulSoup(response.text, 'html.parser')
-    return soup
-
-# use DuckDuckGo to find websites and take the first result
-url = search(query)[0]
-
-# scrape first wesbsite
-soup = scrape_weather_info(url)
-
-print(f"Website: {url}\n\n")
-print(str(soup.body)[:50000]) # limit long outputs
+# keep-alive connections reused across pages, timeouts, at most 2 requests per website at once,
+# and pages cut at 2 MB
+scraper = PooledScraper(per_host=2, timeout=(5, 15), max_bytes=2 * 1024 * 1024)
 
-# extract text
-weather_data = []
-for tag in soup.find_all(['h1', 'h2', 'h3', 'p']):
-    text = tag.get_text(" ", strip=True)
-    weather_data.append(text)
+MAX_CHARS = 5000  # text kept per page, the rest of the page isn't downloaded
 
-# combine all elements into a single string
-weather_data = "\n".join(weather_data)
+def extract_weather_info(chunks):
+    """Text of the headings and paragraphs of a page, parsed while it downloads
+    (chunks), whitespace collapsed, at most MAX_CHARS"""
+    return extract_text(chunks, tags=['h1', 'h2', 'h3', 'p'], max_chars=MAX_CHARS)
 
-# remove all spaces from the combined text
-weather_data = re.sub(r'\s+', ' ', weather_data)
-    
-print(f"Website: {url}\n\n")
-print(weather_data)
+# use DuckDuckGo to find websites and scrape all of them at once,
+# each page is parsed as it arrives
+urls = search(query)
+for page in scraper.scrape_all(urls, extract_weather_info, stream=True):
+    if page.error:
+        print(f"Website: {page.url}\nFailed to retrieve the webpage: {page.error}\n\n")
+        continue
+    print(f"Website: {page.url} ({page.size} bytes in {page.elapsed:.2f} s)\n\n")
+    print(page.value)
 
 
 #### Agentic Search
@@ -96,7 +83,7 @@ print("="*50)
 print("Agentic Search")
 print("="*50)
 # run search
-result = client.search(query, max_results=1)
+result = client.search(query=query, max_results=1)
 
 # print first result
 data = result["results"][0]["content"]
@@ -5,50 +5,63 @@ _ = load_dotenv()
 from langgraph.graph import StateGraph, END
 from typing import TypedDict, Annotated
 import operator
-from langchain_core.messages import AnyMessage, SystemMessage, HumanMessage, ToolMessage
+from langchain_core.messages import AnyMessage, HumanMessage
 from langchain_openai import ChatOpenAI
-from langchain_community.tools.tavily_search import TavilySearchResults
+from agent_helpers import run_tool_calls, arun_tool_calls, CachedTavilySearchResults, BoundGraph, agent_node, graphs
+from agent_helpers import AgentPrompt
+from search_helpers import SearchCache
 
-tool = TavilySearchResults(max_results=2)
+tool = CachedTavilySearchResults(max_results=2, cache=SearchCache())
 
 class AgentState(TypedDict):
     messages: Annotated[list[AnyMessage], operator.add]
 
-from langgraph.checkpoint.sqlite import SqliteSaver
+from checkpoint_helpers import DeltaSqliteSaver
 
-memory = SqliteSaver.from_conn_string(":memory:")
+# Same as SqliteSaver.from_conn_string(":memory:"), but each checkpoint stores only the
+# new messages (plus a full snapshot every 20 checkpoints) instead of the whole list.
+memory = DeltaSqliteSaver.from_conn_string(":memory:")
+
+def exists_action(state: AgentState):
+    result = state['messages'][-1]
+    return len(result.tool_calls) > 0
+
+# Built and compiled once for all the Agents, the nodes call the agent in the config (see lesson2.py)
+def build_graph():
+    graph = StateGraph(AgentState)
+    graph.add_node("llm", agent_node("call_openai"))
+    graph.add_node("action", agent_node("take_action", "atake_action"))
+    graph.add_conditional_edges("llm", exists_action, {True: "action", False: END})
+    graph.add_edge("action", "llm")
+    graph.set_entry_point("llm")
+    return graph
 
 class Agent:
-    def __init__(self, model, tools, checkpointer, system=""): # Passing checkpoint for persistence
+    def __init__(self, model, tools, checkpointer, system="", max_concurrency=4, tool_timeout=None): # Passing checkpoint for persistence
         self.system = system
-        graph = StateGraph(AgentState)
-        graph.add_node("llm", self.call_openai)
-        graph.add_node("action", self.take_action)
-        graph.add_conditional_edges("llm", self.exists_action, {True: "action", False: END})
-        graph.add_edge("action", "llm")
-        graph.set_entry_point("llm")
-        self.graph = graph.compile(checkpointer=checkpointer) # Passing checkpoint for persistence
+        self.max_concurrency = max_concurrency
+        self.tool_timeout = tool_timeout
+        self.graph = BoundGraph(graphs.graph(("agent", AgentState), build_graph, checkpointer), # Passing checkpoint for persistence
+                                {"agent": self})
         self.tools = {t.name: t for t in tools}
-        self.model = model.bind_tools(tools)
+        self.prompt = AgentPrompt(system) # system message made once
+        self.model = graphs.bound_model(model, tools)
 
-    def call_openai(self, state: AgentState):
-        messages = state['messages']
-        if self.system:
-            messages = [SystemMessage(content=self.system)] + messages
-        message = self.model.invoke(messages)
+    def call_openai(self, state: AgentState, config):
+        model = config["configurable"].get("model") # a model given when invoking the graph
+        model = graphs.bound_model(model, self.tools.values()) if model else self.model
+        message = model.invoke(self.prompt.messages(state['messages']))
         return {'messages': [message]}
 
-    def exists_action(self, state: AgentState):
-        result = state['messages'][-1]
-        return len(result.tool_calls) > 0
-
     def take_action(self, state: AgentState):
         tool_calls = state['messages'][-1].tool_calls
-        results = []
-        for t in tool_calls:
-            print(f"Calling: {t}")
-            result = self.tools[t['name']].invoke(t['args'])
-            results.append(ToolMessage(tool_call_id=t['id'], name=t['name'], content=str(result)))
+        results = run_tool_calls(self.tools, tool_calls, self.max_concurrency, self.tool_timeout)
+        print("Back to the model!")
+        return {'messages': results}
+
+    async def atake_action(self, state: AgentState):
+        tool_calls = state['messages'][-1].tool_calls
+        results = await arun_tool_calls(self.tools, tool_calls, self.max_concurrency, self.tool_timeout)
         print("Back to the model!")
         return {'messages': results}
 
@@ -70,12 +83,12 @@ async def stream_tokens():
     print("Streaming tokens")
     print("="*50)
 
-    memory = AsyncSqliteSaver.from_conn_string(":memory:")
-    abot = Agent(model, [tool], system=prompt, checkpointer=memory)
+    # Same agent and compiled graph, with an async checkpointer
+    graph = abot.graph.with_checkpointer(AsyncSqliteSaver.from_conn_string(":memory:"))
 
     messages = [HumanMessage(content="What is the weather in SF?")]
     thread = {"configurable": {"thread_id": "4"}}
-    async for event in abot.graph.astream_events({"messages": messages}, thread, version="v1"):
+    async for event in graph.astream_events({"messages": messages}, thread, version="v1"):
         kind = event["event"]
         if kind == "on_chat_model_stream":
             content = event["data"]["chunk"].content
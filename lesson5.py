@@ -5,15 +5,17 @@ _ = load_dotenv()
 from langgraph.graph import StateGraph, END
 from typing import TypedDict, Annotated
 import operator
-from langchain_core.messages import AnyMessage, SystemMessage, HumanMessage, ToolMessage
+from langchain_core.messages import AnyMessage, HumanMessage, ToolMessage
 from langchain_openai import ChatOpenAI
-from langchain_community.tools.tavily_search import TavilySearchResults
-from langgraph.checkpoint.sqlite import SqliteSaver
+from agent_helpers import run_tool_calls, arun_tool_calls, CachedTavilySearchResults, BoundGraph, agent_node, graphs
+from agent_helpers import AgentPrompt
+from search_helpers import SearchCache
+from checkpoint_helpers import DeltaSqliteSaver
 
-memory = SqliteSaver.from_conn_string(":memory:")
+# Checkpoints store only the messages that changed since the previous one (see lesson4.py).
+memory = DeltaSqliteSaver.from_conn_string(":memory:")
 
-from uuid import uuid4
-from langchain_core.messages import AnyMessage, SystemMessage, HumanMessage, AIMessage
+from langchain_core.messages import AnyMessage, HumanMessage, AIMessage
 
 """
 In previous examples we've annotated the `messages` state key
@@ -23,69 +25,65 @@ appends new messages to the end of the existing messages array.
 Now, to support replacing existing messages, we annotate the
 `messages` key with a customer reducer function, which replaces
 messages with the same `id`, and appends them otherwise.
+The reducer (agent_helpers.reduce_messages) looks messages up by id
+in a dict, so it stays fast on long conversations.
 """
-def reduce_messages(left: list[AnyMessage], right: list[AnyMessage]) -> list[AnyMessage]:
-    # assign ids to messages that don't have them
-    for message in right:
-        if not message.id:
-            message.id = str(uuid4())
-    # merge the new messages with the existing messages
-    merged = left.copy()
-    for message in right:
-        for i, existing in enumerate(merged):
-            # replace any existing messages with the same id
-            if existing.id == message.id:
-                merged[i] = message
-                break
-        else:
-            # append any new messages to the end
-            merged.append(message)
-    return merged
+from agent_helpers import reduce_messages
 
 class AgentState(TypedDict):
     messages: Annotated[list[AnyMessage], reduce_messages]
 
 
 # Tool definition
-tool = TavilySearchResults(max_results=2)
+# Replays from time travel repeat the same queries, those come from the cache.
+tool = CachedTavilySearchResults(max_results=2, cache=SearchCache())
 
 
+def exists_action(state: AgentState):
+    print(state)
+    result = state['messages'][-1]
+    return len(result.tool_calls) > 0
+
+# Built and compiled once for all the Agents, the nodes call the agent in the config (see lesson2.py)
+def build_graph():
+    graph = StateGraph(AgentState)
+    graph.add_node("llm", agent_node("call_openai"))
+    graph.add_node("action", agent_node("take_action", "atake_action"))
+    graph.add_conditional_edges("llm", exists_action, {True: "action", False: END})
+    graph.add_edge("action", "llm")
+    graph.set_entry_point("llm")
+    return graph
+
 # Agent definition with manual human approval.
 class Agent:
-    def __init__(self, model, tools, system="", checkpointer=None):
+    def __init__(self, model, tools, system="", checkpointer=None, max_concurrency=4, tool_timeout=None):
         self.system = system
-        graph = StateGraph(AgentState)
-        graph.add_node("llm", self.call_openai)
-        graph.add_node("action", self.take_action)
-        graph.add_conditional_edges("llm", self.exists_action, {True: "action", False: END})
-        graph.add_edge("action", "llm")
-        graph.set_entry_point("llm")
-        self.graph = graph.compile(
+        self.max_concurrency = max_concurrency
+        self.tool_timeout = tool_timeout
+        self.graph = BoundGraph(graphs.graph(
+            ("agent", AgentState), build_graph,
             checkpointer=checkpointer,
             interrupt_before=["action"] # Manual approval. This interruption happens before we call the action node where all tools are called.
-        )
+        ), {"agent": self})
         self.tools = {t.name: t for t in tools}
-        self.model = model.bind_tools(tools)
+        self.prompt = AgentPrompt(system) # system message made once
+        self.model = graphs.bound_model(model, tools)
 
-    def call_openai(self, state: AgentState):
-        messages = state['messages']
-        if self.system:
-            messages = [SystemMessage(content=self.system)] + messages
-        message = self.model.invoke(messages)
+    def call_openai(self, state: AgentState, config):
+        model = config["configurable"].get("model") # a model given when invoking the graph
+        model = graphs.bound_model(model, self.tools.values()) if model else self.model
+        message = model.invoke(self.prompt.messages(state['messages']))
         return {'messages': [message]}
 
-    def exists_action(self, state: AgentState):
-        print(state)
-        result = state['messages'][-1]
-        return len(result.tool_calls) > 0
-
     def take_action(self, state: AgentState):
         tool_calls = state['messages'][-1].tool_calls
-        results = []
-        for t in tool_calls:
-            print(f"Calling: {t}")
-            result = self.tools[t['name']].invoke(t['args'])
-            results.append(ToolMessage(tool_call_id=t['id'], name=t['name'], content=str(result)))
+        results = run_tool_calls(self.tools, tool_calls, self.max_concurrency, self.tool_timeout)
+        print("Back to the model!")
+        return {'messages': results}
+
+    async def atake_action(self, state: AgentState):
+        tool_calls = state['messages'][-1].tool_calls
+        results = await arun_tool_calls(self.tools, tool_calls, self.max_concurrency, self.tool_timeout)
         print("Back to the model!")
         return {'messages': results}
     
@@ -8,10 +8,16 @@ from langgraph.graph import StateGraph, END
 from typing import TypedDict, Annotated, List
 import operator
 from langgraph.checkpoint.sqlite import SqliteSaver
+from langgraph.pregel.types import StateSnapshot
 from langchain_core.messages import AnyMessage, SystemMessage, HumanMessage, AIMessage, ChatMessage
 from langchain_openai import ChatOpenAI
 from langchain_core.pydantic_v1 import BaseModel
-from tavily import TavilyClient
+from langchain_core.callbacks import BaseCallbackHandler
+from context_helpers import select_content
+from search_helpers import PooledTavilyClient, CachedSearch, SearchCache, research_content, aresearch_content
+from agent_helpers import reduce_content
+from checkpoint_helpers import (PooledSqliteSaver, AsyncPooledSqliteSaver, latest_thread_ts, checkpoint_config,
+                                list_checkpoint_summaries)
 import os
 import sqlite3
 
@@ -21,7 +27,7 @@ class AgentState(TypedDict):
     plan: str
     draft: str
     critique: str
-    content: List[str]
+    content: Annotated[List[str], reduce_content]  # append-only, each snippet once
     queries: List[str]
     revision_number: int
     max_revisions: int
@@ -32,8 +38,15 @@ class Queries(BaseModel):
     queries: List[str]
     
 class ewriter():
-    def __init__(self):
-        self.model = ChatOpenAI(model="gpt-3.5-turbo", temperature=0)
+    def __init__(self, db_path=None, content_budget=1500):
+        ''' db_path: sqlite file to keep the essays across restarts (WAL mode, pooled connections).
+            None keeps them in memory.
+            content_budget: tokens of research content in the writer prompt, the snippets most relevant
+            to the task and critique are picked (None: all of them, near duplicates dropped).
+        '''
+        self.content_budget = content_budget
+        # streaming=True: the model sends tokens to the callbacks as they arrive (live output in the gui)
+        self.model = ChatOpenAI(model="gpt-3.5-turbo", temperature=0, streaming=True)
         self.PLAN_PROMPT = ("You are an expert writer tasked with writing a high level outline of a short 3 paragraph essay. "
                             "Write such an outline for the user provided topic. Give the three main headers of an outline of "
                              "the essay along with any relevant notes or instructions for the sections. ")
@@ -54,7 +67,7 @@ class ewriter():
                                          "be used when making any requested revisions (as outlined below). "
                                          "Generate a list of search queries that will gather any relevant information. "
                                          "Only generate 2 queries max.")
-        self.tavily = TavilyClient(api_key=os.environ["TAVILY_API_KEY"])
+        self.tavily = CachedSearch(PooledTavilyClient(api_key=os.environ["TAVILY_API_KEY"]), SearchCache())
         builder = StateGraph(AgentState)
         builder.add_node("planner", self.plan_node)
         builder.add_node("research_plan", self.research_plan_node)
@@ -71,122 +84,313 @@ class ewriter():
         builder.add_edge("research_plan", "generate")
         builder.add_edge("reflect", "research_critique")
         builder.add_edge("research_critique", "generate")
-        memory = SqliteSaver(conn=sqlite3.connect(":memory:", check_same_thread=False))
         self.graph = builder.compile(
-            checkpointer=memory,
+            checkpointer=self.make_checkpointer(db_path),
             interrupt_after=['planner', 'generate', 'reflect', 'research_plan', 'research_critique']
         )
 
 
-    def plan_node(self, state: AgentState):
-        messages = [
+    def make_checkpointer(self, db_path):
+        if db_path:
+            return PooledSqliteSaver(db_path)
+        return SqliteSaver(conn=sqlite3.connect(":memory:", check_same_thread=False))
+
+    # Each node is its messages, the LLM call and the state update made of the response. Only the
+    # calls differ between ewriter and aewriter (awaited), the rest is shared.
+    def plan_messages(self, state):
+        return [
             SystemMessage(content=self.PLAN_PROMPT), 
             HumanMessage(content=state['task'])
         ]
-        response = self.model.invoke(messages)
+    def plan_update(self, response):
         return {"plan": response.content,
                "lnode": "planner",
                 "count": 1,
                }
-    def research_plan_node(self, state: AgentState):
-        queries = self.model.with_structured_output(Queries).invoke([
+    def research_plan_messages(self, state):
+        return [
             SystemMessage(content=self.RESEARCH_PLAN_PROMPT),
             HumanMessage(content=state['task'])
-        ])
-        content = state['content'] or []  # add to content
-        for q in queries.queries:
-            response = self.tavily.search(query=q, max_results=2)
-            for r in response['results']:
-                content.append(r['content'])
-        return {"content": content,
+        ]
+    def research_plan_update(self, queries, content):
+        return {"content": content,  # added to content
                 "queries": queries.queries,
                "lnode": "research_plan",
                 "count": 1,
                }
-    def generation_node(self, state: AgentState):
-        content = "\n\n".join(state['content'] or [])
+    def select_content(self, state):
+        selection = select_content(state['content'], f"{state['task']} {state.get('critique') or ''}",
+                                   token_budget=self.content_budget)
+        print(f"revision {state.get('revision_number', 1)}: {selection.report()}")
+        return "\n\n".join(selection.items)
+
+    def generation_messages(self, state):
+        content = self.select_content(state)
         user_message = HumanMessage(
             content=f"{state['task']}\n\nHere is my plan:\n\n{state['plan']}")
-        messages = [
+        return [
             SystemMessage(
                 content=self.WRITER_PROMPT.format(content=content)
             ),
             user_message
             ]
-        response = self.model.invoke(messages)
+    def generation_update(self, state, response):
         return {
             "draft": response.content, 
             "revision_number": state.get("revision_number", 1) + 1,
             "lnode": "generate",
             "count": 1,
         }
-    def reflection_node(self, state: AgentState):
-        messages = [
+    def reflection_messages(self, state):
+        return [
             SystemMessage(content=self.REFLECTION_PROMPT), 
             HumanMessage(content=state['draft'])
         ]
-        response = self.model.invoke(messages)
+    def reflection_update(self, response):
         return {"critique": response.content,
                "lnode": "reflect",
                 "count": 1,
         }
-    def research_critique_node(self, state: AgentState):
-        queries = self.model.with_structured_output(Queries).invoke([
+    def research_critique_messages(self, state):
+        return [
             SystemMessage(content=self.RESEARCH_CRITIQUE_PROMPT),
             HumanMessage(content=state['critique'])
-        ])
-        content = state['content'] or []
-        for q in queries.queries:
-            response = self.tavily.search(query=q, max_results=2)
-            for r in response['results']:
-                content.append(r['content'])
+        ]
+    def research_critique_update(self, content):
         return {"content": content,
                "lnode": "research_critique",
                 "count": 1,
         }
+
+    def plan_node(self, state: AgentState):
+        return self.plan_update(self.model.invoke(self.plan_messages(state)))
+    def research_plan_node(self, state: AgentState):
+        queries = self.model.with_structured_output(Queries).invoke(self.research_plan_messages(state))
+        return self.research_plan_update(queries, research_content(self.tavily, queries.queries, max_results=2))
+    def generation_node(self, state: AgentState):
+        return self.generation_update(state, self.model.invoke(self.generation_messages(state)))
+    def reflection_node(self, state: AgentState):
+        return self.reflection_update(self.model.invoke(self.reflection_messages(state)))
+    def research_critique_node(self, state: AgentState):
+        queries = self.model.with_structured_output(Queries).invoke(self.research_critique_messages(state))
+        return self.research_critique_update(research_content(self.tavily, queries.queries, max_results=2))
     def should_continue(self, state):
         if state["revision_number"] > state["max_revisions"]:
             return END
         return "reflect"
 
+class aewriter(ewriter):
+    ''' ewriter with async nodes, for running many essays on one event loop with ainvoke/astream.
+        The LLM calls are awaited, the searches run in threads, and the checkpoints go to an AsyncPooledSqliteSaver,
+        which needs db_path: the gui's sync get_state/update_state read the same file.
+    '''
+    def make_checkpointer(self, db_path):
+        if not db_path:
+            raise ValueError("aewriter needs a db_path, the gui reads its checkpoints back through a sync saver "
+                             "on the same file")
+        return AsyncPooledSqliteSaver(db_path)
+
+    async def plan_node(self, state: AgentState):
+        return self.plan_update(await self.model.ainvoke(self.plan_messages(state)))
+    async def research_plan_node(self, state: AgentState):
+        queries = await self.model.with_structured_output(Queries).ainvoke(self.research_plan_messages(state))
+        return self.research_plan_update(queries, await aresearch_content(self.tavily, queries.queries, max_results=2))
+    async def generation_node(self, state: AgentState):
+        return self.generation_update(state, await self.model.ainvoke(self.generation_messages(state)))
+    async def reflection_node(self, state: AgentState):
+        return self.reflection_update(await self.model.ainvoke(self.reflection_messages(state)))
+    async def research_critique_node(self, state: AgentState):
+        queries = await self.model.with_structured_output(Queries).ainvoke(self.research_critique_messages(state))
+        return self.research_critique_update(await aresearch_content(self.tavily, queries.queries, max_results=2))
+
 import gradio as gr
+import asyncio
 import time
+import queue
+import secrets
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+class TokenQueue(BaseCallbackHandler):
+    ''' Callback handler that puts every streamed LLM token in a queue, with the graph node that produced it '''
+    run_inline = True  # async runs call it in the event loop too, which keeps the tokens in order
+
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.nodes = {}  # llm run_id -> graph node
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+        self.nodes[run_id] = (metadata or {}).get("langgraph_node")
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        if token:
+            self.queue.put((self.nodes.get(run_id), token))
+
+    def drain(self):
+        ''' the (node, token) pairs queued so far '''
+        items = []
+        while not self.queue.empty():
+            items.append(self.queue.get())
+        return items
+
+class OutputLog():
+    ''' Bounded log of the agent output of one thread: keeps the newest chunks up to max_chars,
+        older ones are dropped (the full output can be rebuilt from the checkpoints, see full_output) '''
+    def __init__(self, max_chars=8000):
+        self.max_chars = max_chars
+        self.chunks = deque()
+        self.size = 0
+
+    def append(self, chunk):
+        chunk = chunk[-self.max_chars:]
+        self.chunks.append(chunk)
+        self.size += len(chunk)
+        while self.size > self.max_chars:
+            self.size -= len(self.chunks.popleft())
+
+    def render(self, tail=""):
+        ''' visible text: the kept chunks plus tail (e.g. tokens still streaming) '''
+        return "".join(self.chunks) + tail
+
+class writer_session():
+    ''' What one browser session is doing: its current thread, the threads it can pick (the ones it
+        started or resumed), run counters and output logs. Each session runs its own checkpointer threads. '''
+    def __init__(self):
+        self.threads = []
+        self.iterations = {}  # thread_id -> invokes run
+        self.response = {}
+        self.logs = {}  # thread_id -> OutputLog
+        self.snapshots = {}  # thread_id -> StateSnapshot of its latest checkpoint, see writer_gui.current_state
+        self.last_used = time.monotonic()
+        self.switch(-1)  # no thread until the first essay
+
+    def switch(self, thread_id):
+        self.thread_id = thread_id
+        self.thread = self.config(thread_id)
+
+    @staticmethod
+    def config(thread_id):
+        return {"configurable": {"thread_id": str(thread_id)}}
 
 class writer_gui( ):
-    def __init__(self, graph, share=False):
+    run_concurrency_limit = 4  # essays gradio runs at once, each one holds a worker thread
+
+    def __init__(self, graph, share=False, hist_limit=100, snapshot_page_size=10, session_ttl=3600, max_sessions=100):
         self.graph = graph
         self.share = share
-        self.partial_message = ""
-        self.response = {}
+        self.hist_limit = hist_limit  # entries of the step pulldown, latest first
+        self.snapshot_page_size = snapshot_page_size  # snapshots per page of the StateSnapShots tab
         self.max_iterations = 10
-        self.iterations = []
-        self.threads = []
-        self.thread_id = -1
-        self.thread = {"configurable": {"thread_id": str(self.thread_id)}}
+        # sessions (gr.Request.username with auth, else session_hash -> writer_session), least recently used
+        # first. Sessions idle for session_ttl seconds, or the oldest when a new one would go past max_sessions,
+        # are dropped with their logs; their essays stay in the checkpointer, see resume_thread.
+        self.sessions = OrderedDict()
+        self.session_ttl = session_ttl
+        self.max_sessions = max_sessions
+        self.lock = threading.Lock()
+        # resume thread numbering from the threads already in a persistent checkpointer
+        saved_threads = [int(tid.split("-")[0]) for tid in getattr(graph.checkpointer, "thread_ids", list)()
+                         if tid.split("-")[0].isdigit()]
+        self.next_thread_id = max(saved_threads) + 1 if saved_threads else 0
         #self.sdisps = {} #global    
         self.demo = self.create_interface()
 
-    def run_agent(self, start,topic,stop_after):
-        #global partial_message, thread_id,thread
-        #global response, max_iterations, iterations, threads
+    def session(self, request):
+        ''' the writer_session of the user (gradio auth) or browser session making request (one shared session
+            without request) '''
+        key = (getattr(request, "username", None) or request.session_hash) if request is not None else None
+        now = time.monotonic()
+        with self.lock:
+            while self.sessions and now - next(iter(self.sessions.values())).last_used >= self.session_ttl:
+                self.sessions.popitem(last=False)
+            if key not in self.sessions and len(self.sessions) >= self.max_sessions:
+                self.sessions.popitem(last=False)
+            session = self.sessions.pop(key, None) or writer_session()
+            session.last_used = now
+            self.sessions[key] = session
+        return session
+
+    def new_thread(self, session):
+        ''' thread ids are a counter and a random part: shown in the Thread box, they let whoever has one resume
+            the essay from another session, or after a restart, and can't be guessed from the others '''
+        with self.lock:
+            thread_id = f"{self.next_thread_id}-{secrets.token_hex(8)}"
+            self.next_thread_id += 1
+        session.threads.append(thread_id)
+        session.switch(thread_id)
+
+    def resume_thread(self, thread_id, request: gr.Request = None):
+        ''' adds a thread of the checkpointer to the threads of the session and switches to it '''
+        session = self.session(request)
+        thread_id = thread_id.strip()
+        if thread_id not in session.threads:
+            if latest_thread_ts(self.graph.checkpointer, thread_id) is None:
+                raise gr.Error(f"No saved essay with thread {thread_id}")
+            session.threads.append(thread_id)
+        session.switch(thread_id)
+        return self.output_log(session, thread_id).render()
+
+    def start_run(self, session, start, topic):
+        ''' sets the thread to run (a new one if start) and returns the input of its first invoke '''
         if start:
-            self.iterations.append(0)
             config = {'task': topic,"max_revisions": 2,"revision_number": 0,
                       'lnode': "", 'planner': "no plan", 'draft': "no draft", 'critique': "no critique", 
                       'content': ["no content",], 'queries': "no queries", 'count':0}
-            self.thread_id += 1  # new agent, new thread
-            self.threads.append(self.thread_id)
+            self.new_thread(session)  # new agent, new thread
         else:
+            self.check_thread(session)
             config = None
-        self.thread = {"configurable": {"thread_id": str(self.thread_id)}}
-        while self.iterations[self.thread_id] < self.max_iterations:
-            self.response = self.graph.invoke(config, self.thread)
-            self.iterations[self.thread_id] += 1
-            self.partial_message += str(self.response)
-            self.partial_message += f"\n------------------\n\n"
-            ## fix
-            lnode,nnode,_,rev,acount = self.get_disp_state()
-            yield self.partial_message,lnode,nnode,self.thread_id,rev,acount
+        session.iterations.setdefault(session.thread_id, 0)
+        return config
+
+    def check_thread(self, session):
+        ''' refuses to change the current thread of a session that hasn't started one '''
+        if session.thread_id not in session.threads:
+            raise gr.Error("No essay in this session yet, generate one first")
+
+    def end_step(self, session, thread_id, log, response, snapshot=None):
+        ''' records the result of one invoke of thread_id, the thread the run started on (the session can switch
+            threads meanwhile). snapshot: its new state if the caller has it already.
+            Returns lnode, nnode and the update of the live and draft boxes '''
+        session.response = response
+        session.last_used = time.monotonic()  # a long run keeps its session
+        if snapshot is None:
+            self.invalidate_state(session, thread_id)
+        else:
+            session.snapshots[thread_id] = snapshot
+        session.iterations[thread_id] += 1
+        log.append(str(session.response) + f"\n------------------\n\n")
+        ## fix
+        lnode,nnode,_,rev,acount = self.get_disp_state(session, thread_id)
+        return lnode, nnode, (log.render(), session.response.get("draft", "") if lnode == "generate" else gr.update())
+
+    def run_agent(self, start,topic,stop_after, request: gr.Request = None):
+        #global partial_message, thread_id,thread
+        #global response, max_iterations, iterations, threads
+        session = self.session(request)
+        config = self.start_run(session, start, topic)
+        thread_id, thread = session.thread_id, session.thread  # the run's thread, whatever the session switches to
+        log = self.output_log(session, thread_id)
+        while session.iterations[thread_id] < self.max_iterations:
+            # invoke runs in a worker thread, tokens are shown (live box, and draft box for 'generate') as they arrive
+            tokens = TokenQueue()
+            streamed, draft = "", ""
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                future = executor.submit(self.graph.invoke, config, {**thread, "callbacks": [tokens]})
+                while not future.done() or not tokens.queue.empty():
+                    try:
+                        first = tokens.queue.get(timeout=0.05)
+                    except queue.Empty:
+                        continue
+                    for node, token in [first] + tokens.drain():  # send what arrived meanwhile in one update
+                        streamed += token
+                        if node == "generate":
+                            draft += token
+                    yield log.render(streamed[-log.max_chars:]), draft if draft else gr.update()
+                response = future.result()
+            lnode, nnode, boxes = self.end_step(session, thread_id, log, response)
+            yield boxes
             config = None #need
             #print(f"run_agent:{lnode}")
             if not nnode:  
@@ -200,70 +404,142 @@ class writer_gui( ):
                 pass
         return
     
-    def get_disp_state(self,):
-        current_state = self.graph.get_state(self.thread)
+    def output_log(self, session, thread_id):
+        if thread_id not in session.logs:
+            session.logs[thread_id] = OutputLog()
+        return session.logs[thread_id]
+
+    def full_output(self, request: gr.Request = None):
+        ''' complete output of the current thread, rebuilt from its checkpoints instead of kept in memory '''
+        session = self.session(request)
+        writes = []
+        # curiously, this generator returns the latest first
+        for state in self.graph.get_state_history(session.thread):
+            if state.metadata.get('writes'):
+                writes.append(str(state.metadata['writes']))
+        return "".join(w + "\n------------------\n\n" for w in reversed(writes))
+
+    def current_state(self, session, thread_id=None):
+        ''' graph.get_state of thread_id (default: the session's current thread), deserialized once per checkpoint
+            and shared by all the accessors of a refresh.
+            The cached snapshot is used while the thread's latest checkpoint (a primary key lookup) is the same one. '''
+        thread_id = session.thread_id if thread_id is None else thread_id
+        thread_ts = latest_thread_ts(self.graph.checkpointer, thread_id)
+        snapshot = session.snapshots.get(thread_id)
+        if snapshot is None or thread_ts is None or snapshot.config['configurable'].get('thread_ts') != thread_ts:
+            snapshot = self.graph.get_state(session.config(thread_id))
+            session.snapshots[thread_id] = snapshot
+        return snapshot
+
+    def invalidate_state(self, session, thread_id=None):
+        session.snapshots.pop(session.thread_id if thread_id is None else thread_id, None)
+
+    def get_disp_state(self, session, thread_id=None):
+        thread_id = session.thread_id if thread_id is None else thread_id
+        current_state = self.current_state(session, thread_id)
         lnode = current_state.values["lnode"]
         acount = current_state.values["count"]
         rev = current_state.values["revision_number"]
         nnode = current_state.next
-        #print  (lnode,nnode,self.thread_id,rev,acount)
-        return lnode,nnode,self.thread_id,rev,acount
+        #print  (lnode,nnode,thread_id,rev,acount)
+        return lnode,nnode,thread_id,rev,acount
     
-    def get_state(self,key):
-        current_values = self.graph.get_state(self.thread)
+    def get_state(self,key, request: gr.Request = None):
+        session = self.session(request)
+        current_values = self.current_state(session)
         if key in current_values.values:
-            lnode,nnode,self.thread_id,rev,astep = self.get_disp_state()
-            new_label = f"last_node: {lnode}, thread_id: {self.thread_id}, rev: {rev}, step: {astep}"
+            lnode,nnode,thread_id,rev,astep = self.get_disp_state(session)
+            new_label = f"last_node: {lnode}, thread_id: {thread_id}, rev: {rev}, step: {astep}"
             return gr.update(label=new_label, value=current_values.values[key])
         else:
             return ""  
     
-    def get_content(self,):
-        current_values = self.graph.get_state(self.thread)
+    def get_content(self, request: gr.Request = None):
+        session = self.session(request)
+        current_values = self.current_state(session)
         if "content" in current_values.values:
             content = current_values.values["content"]
-            lnode,nnode,thread_id,rev,astep = self.get_disp_state()
-            new_label = f"last_node: {lnode}, thread_id: {self.thread_id}, rev: {rev}, step: {astep}"
+            lnode,nnode,thread_id,rev,astep = self.get_disp_state(session)
+            new_label = f"last_node: {lnode}, thread_id: {thread_id}, rev: {rev}, step: {astep}"
             return gr.update(label=new_label, value="\n\n".join(item for item in content) + "\n\n")
         else:
             return ""  
     
-    def update_hist_pd(self,):
-        #print("update_hist_pd")
+    def hist_choices(self, session, limit=None, before=None):
+        ''' step pulldown entries, latest first. Reads only count/lnode/revision_number and the versions
+            that give the next node from each checkpoint, not the whole state (content, drafts...).
+            limit/before page through long threads, before is a thread_ts. Returns the entries and the thread_ts
+            to pass as before for the next (older) page, None on the last one. '''
         hist = []
-        # curiously, this generator returns the latest first
-        for state in self.graph.get_state_history(self.thread):
-            if state.metadata['step'] < 1:
+        limit = limit or self.hist_limit
+        before = checkpoint_config(self.graph.checkpointer, session.thread_id, before) if before else None
+        summaries = list_checkpoint_summaries(self.graph, session.thread, limit=limit + 1, before=before)
+        older = summaries[limit - 1].config['configurable']['thread_ts'] if len(summaries) > limit else None
+        for summary in summaries[:limit]:
+            if (summary.step or 0) < 1:  #ignore early states, and checkpoints without a step
                 continue
-            thread_ts = state.config['configurable']['thread_ts']
-            tid = state.config['configurable']['thread_id']
-            count = state.values['count']
-            lnode = state.values['lnode']
-            rev = state.values['revision_number']
-            nnode = state.next
+            thread_ts = summary.config['configurable']['thread_ts']
+            tid = summary.config['configurable']['thread_id']
+            count = summary.values['count']
+            lnode = summary.values['lnode']
+            rev = summary.values['revision_number']
+            nnode = summary.next
             st = f"{tid}:{count}:{lnode}:{nnode}:{rev}:{thread_ts}"
             hist.append(st)
+        return hist, older
+
+    def update_hist_pd(self, request: gr.Request = None):
+        #print("update_hist_pd")
+        hist, _ = self.hist_choices(self.session(request))
         return gr.Dropdown(label="update_state from: thread:count:last_node:next_node:rev:thread_ts", 
                            choices=hist, value=hist[0],interactive=True)
     
-    def find_config(self,thread_ts):
-        for state in self.graph.get_state_history(self.thread):
-            config = state.config
-            if config['configurable']['thread_ts'] == thread_ts:
-                return config
-        return(None)
+    def snapshot_page(self, session, before=None):
+        ''' one page of the StateSnapShots summary, latest first, and the thread_ts to pass as before for the next
+            page (None on the last one). plan/draft/critique and the content items come truncated from the checkpoint
+            store, the full documents are not loaded. '''
+        before = checkpoint_config(self.graph.checkpointer, session.thread_id, before) if before else None
+        summaries = list_checkpoint_summaries(self.graph, session.thread, channels=self.graph.output_channels,
+                                              truncate={'plan': 80, 'draft': 80, 'critique': 80, 'content': 20},
+                                              limit=self.snapshot_page_size + 1, before=before)
+        sstate = ""
+        for summary in summaries[:self.snapshot_page_size]:
+            values = summary.values
+            for key in ['plan', 'draft', 'critique']:
+                if isinstance(values.get(key), str):  # None before the node that writes it has run
+                    values[key] = values[key] + "..."
+            if isinstance(values.get('content'), list):
+                values['content'] = [item + '...' if isinstance(item, str) else item for item in values['content']]
+            metadata = {'source': summary.source, 'step': summary.step}
+            if summary.has_writes:
+                metadata['writes'] = "not shown"
+            state = StateSnapshot(values, summary.next, summary.config, metadata, summary.created_at,
+                                  summary.parent_config)
+            sstate += str(state) + "\n\n"
+        if len(summaries) > self.snapshot_page_size:
+            return sstate, summaries[self.snapshot_page_size - 1].config['configurable']['thread_ts']
+        return sstate, None
+
+    def find_config(self, session, thread_ts):
+        ''' config of the checkpoint thread_ts of the current thread (primary key lookup, no history scan) '''
+        return checkpoint_config(self.graph.checkpointer, session.thread_id, thread_ts)
             
-    def copy_state(self,hist_str):
+    def copy_state(self,hist_str, request: gr.Request = None):
         ''' result of selecting an old state from the step pulldown. Note does not change thread. 
              This copies an old state to a new current state. 
         '''
+        session = self.session(request)
+        self.check_thread(session)
         thread_ts = hist_str.split(":")[-1]
         #print(f"copy_state from {thread_ts}")
-        config = self.find_config(thread_ts)
+        config = self.find_config(session, thread_ts)
         #print(config)
-        state = self.graph.get_state(config)
-        self.graph.update_state(self.thread, state.values, as_node=state.values['lnode'])
-        new_state = self.graph.get_state(self.thread)  #should now match
+        if config is None:
+            raise gr.Error(f"checkpoint {thread_ts} not found in thread {session.thread_id}")
+        state = self.graph.get_state(config)  # loads only that checkpoint
+        self.graph.update_state(session.thread, state.values, as_node=state.values['lnode'])
+        self.invalidate_state(session)
+        new_state = self.current_state(session)  #should now match
         new_thread_ts = new_state.config['configurable']['thread_ts']
         tid = new_state.config['configurable']['thread_id']
         count = new_state.values['count']
@@ -272,46 +548,41 @@ class writer_gui( ):
         nnode = new_state.next
         return lnode,nnode,new_thread_ts,rev,count
     
-    def update_thread_pd(self,):
+    def update_thread_pd(self, request: gr.Request = None):
         #print("update_thread_pd")
-        return gr.Dropdown(label="choose thread", choices=threads, value=self.thread_id,interactive=True)
+        session = self.session(request)
+        return gr.Dropdown(label="choose thread", choices=session.threads, value=session.thread_id,interactive=True)
     
-    def switch_thread(self,new_thread_id):
+    def switch_thread(self,new_thread_id, request: gr.Request = None):
         #print(f"switch_thread{new_thread_id}")
-        self.thread = {"configurable": {"thread_id": str(new_thread_id)}}
-        self.thread_id = new_thread_id
-        return 
+        session = self.session(request)
+        if new_thread_id not in session.threads:  # only the threads this session started or resumed
+            raise gr.Error(f"Thread {new_thread_id} is not one of this session's")
+        session.switch(new_thread_id)
+        return self.output_log(session, new_thread_id).render()
     
-    def modify_state(self,key,asnode,new_state):
+    def modify_state(self,key,asnode,new_state, request: gr.Request = None):
         ''' gets the current state, modifes a single value in the state identified by key, and updates state with it.
         note that this will create a new 'current state' node. If you do this multiple times with different keys, it will create
         one for each update. Note also that it doesn't resume after the update
         '''
-        current_values = self.graph.get_state(self.thread)
-        current_values.values[key] = new_state
-        self.graph.update_state(self.thread, current_values.values,as_node=asnode)
+        session = self.session(request)
+        self.check_thread(session)
+        current_values = self.current_state(session)
+        values = {**current_values.values, key: new_state}  # the cached snapshot is left as it is
+        self.graph.update_state(session.thread, values,as_node=asnode)
+        self.invalidate_state(session)
         return
 
 
     def create_interface(self):
         with gr.Blocks(theme=gr.themes.Default(spacing_size='sm',text_size="sm")) as demo:
             
-            def updt_disp():
+            def updt_disp(request: gr.Request):
                 ''' general update display on state change '''
-                current_state = self.graph.get_state(self.thread)
-                hist = []
-                # curiously, this generator returns the latest first
-                for state in self.graph.get_state_history(self.thread):
-                    if state.metadata['step'] < 1:  #ignore early states
-                        continue
-                    s_thread_ts = state.config['configurable']['thread_ts']
-                    s_tid = state.config['configurable']['thread_id']
-                    s_count = state.values['count']
-                    s_lnode = state.values['lnode']
-                    s_rev = state.values['revision_number']
-                    s_nnode = state.next
-                    st = f"{s_tid}:{s_count}:{s_lnode}:{s_nnode}:{s_rev}:{s_thread_ts}"
-                    hist.append(st)
+                session = self.session(request)
+                current_state = self.current_state(session)
+                hist, older = self.hist_choices(session)
                 if not current_state.metadata: #handle init call
                     return{}
                 else:
@@ -321,25 +592,30 @@ class writer_gui( ):
                         count_bx : current_state.values["count"],
                         revision_bx : current_state.values["revision_number"],
                         nnode_bx : current_state.next,
-                        threadid_bx : self.thread_id,
-                        thread_pd : gr.Dropdown(label="choose thread", choices=self.threads, value=self.thread_id,interactive=True),
+                        threadid_bx : session.thread_id,
+                        thread_pd : gr.Dropdown(label="choose thread", choices=session.threads, value=session.thread_id,interactive=True),
                         step_pd : gr.Dropdown(label="update_state from: thread:count:last_node:next_node:rev:thread_ts", 
                                choices=hist, value=hist[0],interactive=True),
+                        steps_before : older,
+                        older_steps_btn : gr.update(visible=older is not None),
                     }
-            def get_snapshots():
-                new_label = f"thread_id: {self.thread_id}, Summary of snapshots"
-                sstate = ""
-                for state in self.graph.get_state_history(self.thread):
-                    for key in ['plan', 'draft', 'critique']:
-                        if key in state.values:
-                            state.values[key] = state.values[key][:80] + "..."
-                    if 'content' in state.values:
-                        for i in range(len(state.values['content'])):
-                            state.values['content'][i] = state.values['content'][i][:20] + '...'
-                    if 'writes' in state.metadata:
-                        state.metadata['writes'] = "not shown"
-                    sstate += str(state) + "\n\n"
-                return gr.update(label=new_label, value=sstate)
+            def older_steps(before, request: gr.Request):
+                ''' replaces the step pulldown entries with the next (older) page '''
+                hist, before = self.hist_choices(self.session(request), before=before)
+                return (gr.Dropdown(label="update_state from (older steps): thread:count:last_node:next_node:rev:thread_ts",
+                                    choices=hist, value=None, interactive=True),
+                        before, gr.update(visible=before is not None))
+
+            def get_snapshots(request: gr.Request):
+                session = self.session(request)
+                new_label = f"thread_id: {session.thread_id}, Summary of snapshots"
+                sstate, before = self.snapshot_page(session)
+                return gr.update(label=new_label, value=sstate), before, gr.update(visible=before is not None)
+
+            def more_snapshots(sstate, before, request: gr.Request):
+                ''' appends the next (older) page '''
+                page, before = self.snapshot_page(self.session(request), before)
+                return sstate + page, before, gr.update(visible=before is not None)
 
             def vary_btn(stat):
                 #print(f"vary_btn{stat}")
@@ -361,24 +637,37 @@ class writer_gui( ):
                     checks.remove('__start__')
                     stop_after = gr.CheckboxGroup(checks,label="Interrupt After State", value=checks, scale=0, min_width=400)
                     with gr.Row():
-                        thread_pd = gr.Dropdown(choices=self.threads,interactive=True, label="select thread", min_width=120, scale=0)
+                        thread_pd = gr.Dropdown(choices=[],interactive=True, label="select thread", min_width=120, scale=0)
                         step_pd = gr.Dropdown(choices=['N/A'],interactive=True, label="select step", min_width=160, scale=1)
+                        older_steps_btn = gr.Button("Older steps", scale=0, min_width=80, visible=False)
+                        full_btn = gr.Button("Full Output", scale=0, min_width=80)
+                    with gr.Row():
+                        resume_bx = gr.Textbox(label="resume thread (its id from the Thread box)", min_width=160, scale=1)
+                        resume_btn = gr.Button("Resume", scale=0, min_width=80)
+                    steps_before = gr.State(None)  # thread_ts the next older page of steps starts before
                 live = gr.Textbox(label="Live Agent Output", lines=5, max_lines=5)
+                # rendered in the Draft tab, created here so the draft can stream into it while generating
+                draft_bx = gr.Textbox(label="draft", lines=10, interactive=True, render=False)
         
                 # actions
-                sdisps =[topic_bx,lnode_bx,nnode_bx,threadid_bx,revision_bx,count_bx,step_pd,thread_pd]
-                thread_pd.input(self.switch_thread, [thread_pd], None).then(
+                sdisps =[topic_bx,lnode_bx,nnode_bx,threadid_bx,revision_bx,count_bx,step_pd,thread_pd,steps_before,older_steps_btn]
+                thread_pd.input(self.switch_thread, [thread_pd], live).then(
                                 fn=updt_disp, inputs=None, outputs=sdisps)
                 step_pd.input(self.copy_state,[step_pd],None).then(
                               fn=updt_disp, inputs=None, outputs=sdisps)
+                resume_btn.click(self.resume_thread, [resume_bx], live).then(
+                                 fn=updt_disp, inputs=None, outputs=sdisps)
+                older_steps_btn.click(fn=older_steps, inputs=steps_before, outputs=[step_pd, steps_before, older_steps_btn])
+                full_btn.click(fn=self.full_output, inputs=None, outputs=live)
                 gen_btn.click(vary_btn,gr.Number("secondary", visible=False), gen_btn).then(
-                              fn=self.run_agent, inputs=[gr.Number(True, visible=False),topic_bx,stop_after], outputs=[live],show_progress=True).then(
+                              fn=self.run_agent, inputs=[gr.Number(True, visible=False),topic_bx,stop_after], outputs=[live,draft_bx],show_progress=True,
+                              concurrency_limit=self.run_concurrency_limit).then(
                               fn=updt_disp, inputs=None, outputs=sdisps).then( 
                               vary_btn,gr.Number("primary", visible=False), gen_btn).then(
                               vary_btn,gr.Number("primary", visible=False), cont_btn)
                 cont_btn.click(vary_btn,gr.Number("secondary", visible=False), cont_btn).then(
                                fn=self.run_agent, inputs=[gr.Number(False, visible=False),topic_bx,stop_after], 
-                               outputs=[live]).then(
+                               outputs=[live,draft_bx], concurrency_limit=self.run_concurrency_limit).then(
                                fn=updt_disp, inputs=None, outputs=sdisps).then(
                                vary_btn,gr.Number("primary", visible=False), cont_btn)
         
@@ -399,7 +688,7 @@ class writer_gui( ):
                 with gr.Row():
                     refresh_btn = gr.Button("Refresh")
                     modify_btn = gr.Button("Modify")
-                draft_bx = gr.Textbox(label="draft", lines=10, interactive=True)
+                draft_bx.render()
                 refresh_btn.click(fn=self.get_state, inputs=gr.Number("draft", visible=False), outputs=draft_bx)
                 modify_btn.click(fn=self.modify_state, inputs=[gr.Number("draft", visible=False),
                                                           gr.Number("generate", visible=False), draft_bx], outputs=None).then(
@@ -418,7 +707,11 @@ class writer_gui( ):
                 with gr.Row():
                     refresh_btn = gr.Button("Refresh")
                 snapshots = gr.Textbox(label="State Snapshots Summaries")
-                refresh_btn.click(fn=get_snapshots, inputs=None, outputs=snapshots)
+                snapshots_before = gr.State(None)
+                more_btn = gr.Button("Older snapshots", visible=False)
+                refresh_btn.click(fn=get_snapshots, inputs=None, outputs=[snapshots, snapshots_before, more_btn])
+                more_btn.click(fn=more_snapshots, inputs=[snapshots, snapshots_before],
+                               outputs=[snapshots, snapshots_before, more_btn])
         return demo
 
     def launch(self, share=None):
@@ -427,6 +720,44 @@ class writer_gui( ):
         else:
             self.demo.launch(share=self.share)
 
-MultiAgent = ewriter()
-app = writer_gui(MultiAgent.graph)
-app.launch()
\ No newline at end of file
+class awriter_gui(writer_gui):
+    ''' writer_gui for an aewriter graph. run_agent is an async generator: gradio runs it on its event loop,
+        so an essay waiting on the LLM doesn't hold a worker thread. The other accessors are quick reads and stay sync.
+    '''
+    run_concurrency_limit = None  # no limit, the essays only wait on the event loop
+    async def run_agent(self, start,topic,stop_after, request: gr.Request = None):
+        session = self.session(request)
+        config = self.start_run(session, start, topic)
+        thread_id, thread = session.thread_id, session.thread  # the run's thread, whatever the session switches to
+        log = self.output_log(session, thread_id)
+        while session.iterations[thread_id] < self.max_iterations:
+            tokens = TokenQueue()
+            streamed, draft = "", ""
+            task = asyncio.ensure_future(self.graph.ainvoke(config, {**thread, "callbacks": [tokens]}))
+            while not task.done() or not tokens.queue.empty():
+                items = tokens.drain()
+                if not items:
+                    await asyncio.wait({task}, timeout=0.05)
+                    continue
+                for node, token in items:
+                    streamed += token
+                    if node == "generate":
+                        draft += token
+                yield log.render(streamed[-log.max_chars:]), draft if draft else gr.update()
+            response = await task
+            snapshot = await self.graph.aget_state(thread)
+            lnode, nnode, boxes = self.end_step(session, thread_id, log, response, snapshot)
+            yield boxes
+            config = None
+            if not nnode or lnode in stop_after:
+                return
+
+if __name__ == "__main__":
+    # WRITER_ASYNC=1 runs the essays with async nodes on gradio's event loop
+    if os.getenv("WRITER_ASYNC"):
+        MultiAgent = aewriter(db_path=os.getenv("WRITER_DB", "writer_checkpoints.sqlite"))
+        app = awriter_gui(MultiAgent.graph)
+    else:
+        MultiAgent = ewriter(db_path=os.getenv("WRITER_DB", "writer_checkpoints.sqlite"))
+        app = writer_gui(MultiAgent.graph)
+    app.launch()
\ No newline at end of file
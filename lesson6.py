@@ -5,10 +5,12 @@ _ = load_dotenv()
 from langgraph.graph import StateGraph, END
 from typing import TypedDict, Annotated, List
 import operator
-from langgraph.checkpoint.sqlite import SqliteSaver
 from langchain_core.messages import AnyMessage, SystemMessage, HumanMessage, AIMessage, ChatMessage
+from checkpoint_helpers import DeltaSqliteSaver
+from agent_helpers import reduce_content
 
-memory = SqliteSaver.from_conn_string(":memory:")
+# content only grows (see reduce_content), checkpoints store only the snippets added at each step
+memory = DeltaSqliteSaver.from_conn_string(":memory:")
 
 
 # Graph state definition.
@@ -17,7 +19,7 @@ class AgentState(TypedDict):
     plan: str # plan that the planning step will generate.
     draft: str # draft of the essay.
     critique: str # Populated by critique step.
-    content: List[str] # List of documents that Tavily has researched.
+    content: Annotated[List[str], reduce_content] # List of documents that Tavily has researched, each one once.
     revision_number: int # Keep track revision were made.
     max_revisions: int # Keep track max revision limit to decide to stop or not.
 
@@ -34,9 +36,12 @@ class Queries(BaseModel):
 
 
 # Importing Tool
-from tavily import TavilyClient
+# Same search() as TavilyClient, over a pooled keep-alive HTTP session so the
+# research nodes can send all their queries at once.
+from search_helpers import PooledTavilyClient, CachedSearch, SearchCache, research_content
 import os
-tavily = TavilyClient(api_key=os.environ["TAVILY_API_KEY"])
+# Essay revisions often repeat queries, those are answered from the cache.
+tavily = CachedSearch(PooledTavilyClient(api_key=os.environ["TAVILY_API_KEY"]), SearchCache())
 
 
 # plan_node
@@ -63,12 +68,9 @@ def research_plan_node(state: AgentState):
         SystemMessage(content=RESEARCH_PLAN_PROMPT),
         HumanMessage(content=state['task'])
     ])
-    content = state['content'] or []
-    for q in queries.queries:
-        response = tavily.search(query=q, max_results=2)
-        for r in response['results']:
-            content.append(r['content'])
-    return {"content": content}
+    # All queries are searched concurrently, results are added in query order.
+    # Only the new snippets are returned, reduce_content appends them to content.
+    return {"content": research_content(tavily, queries.queries, max_results=2)}
 
 
 # generation_node
@@ -81,8 +83,16 @@ Utilize all the information below as needed:
 
 {content}"""
 
+# Only the research snippets most relevant to the task and critique go in the prompt,
+# up to this many tokens, near duplicates dropped. content keeps growing every revision.
+from context_helpers import select_content
+CONTENT_TOKEN_BUDGET = 1500
+
 def generation_node(state: AgentState):
-    content = "\n\n".join(state['content'] or [])
+    selection = select_content(state['content'], f"{state['task']} {state.get('critique') or ''}",
+                               token_budget=CONTENT_TOKEN_BUDGET)
+    print(f"revision {state.get('revision_number', 1)}: {selection.report()}")
+    content = "\n\n".join(selection.items)
     user_message = HumanMessage(
         content=f"{state['task']}\n\nHere is my plan:\n\n{state['plan']}")
     messages = [
@@ -122,12 +132,9 @@ def research_critique_node(state: AgentState):
         SystemMessage(content=RESEARCH_CRITIQUE_PROMPT),
         HumanMessage(content=state['critique'])
     ])
-    content = state['content'] or []
-    for q in queries.queries:
-        response = tavily.search(query=q, max_results=2)
-        for r in response['results']:
-            content.append(r['content'])
-    return {"content": content}
+    # All queries are searched concurrently, results are added in query order.
+    # Only the new snippets are returned, reduce_content appends them to content.
+    return {"content": research_content(tavily, queries.queries, max_results=2)}
 
 
 # Conditional behavior
@@ -0,0 +1,234 @@
+"""Helpers for the ReAct loop of the agent from scratch (lesson 1)."""
+import re
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import NamedTuple, Optional
+
+from context_helpers import count_tokens
+
+ACTION_RE = re.compile(r'^Action: (\w+): (.*)$', re.MULTILINE)
+
+
+def parse_action(text, pattern=ACTION_RE):
+    """(action, input) of the first `Action: name: input` line of a model response,
+    or None. One scan of the text, stopping at the first match."""
+    match = pattern.search(text)
+    return match.groups() if match else None
+
+
+class ActionParser:
+    """Finds the first `Action: name: input` line of a model response fed chunk by
+    chunk (e.g. the tokens of a streamed completion), each line looked at once,
+    when it is complete. action is set as soon as its line is, paused once the
+    PAUSE line after it arrives: the action can run before the rest of the
+    completion, which is only more text after PAUSE."""
+
+    def __init__(self, pattern=ACTION_RE):
+        self.pattern = pattern
+        self.text = []  # every chunk fed, the response so far
+        self.line = ""  # the incomplete last line
+        self.action = None  # (action, input)
+        self.paused = False
+
+    def feed(self, chunk):
+        """Adds chunk of the response, returns True once the action and PAUSE are in."""
+        self.text.append(chunk)
+        if "\n" not in chunk:
+            self.line += chunk
+        else:
+            *lines, self.line = (self.line + chunk).split("\n")
+            for line in lines:
+                self._line(line)
+        # PAUSE is usually the end of the response, there may be no newline after it
+        if self.action and self.line.strip() == "PAUSE":
+            self.paused = True
+        return self.paused
+
+    def _line(self, line):
+        if self.action is None:
+            match = self.pattern.match(line)
+            if match:
+                self.action = match.groups()
+        elif line.strip() == "PAUSE":
+            self.paused = True
+
+    def close(self):
+        """Ends the response, returns the action found or None."""
+        if self.line:
+            self._line(self.line)
+            self.line = ""
+        return self.action
+
+    def response(self):
+        return "".join(self.text)
+
+
+# Streamed turns
+_executor = ThreadPoolExecutor(max_workers=4)  # actions started while their completion streams
+
+
+class StreamedTurn(NamedTuple):
+    text: str  # the response, up to PAUSE if the rest was cancelled
+    action: Optional[tuple]  # (action, input), None if there was none
+    result: Optional[Future]  # of the action started during the stream, None if it wasn't known
+    cancelled: bool  # generation stopped at PAUSE
+    action_at: Optional[float]  # seconds from the stream's first read to the start of the action
+
+
+def stream_turn(stream, actions, stop_at_pause=True, executor=None):
+    """Reads a streamed chat completion (openai create(..., stream=True)) and starts
+    actions[name](input) on executor as soon as the Action line is complete, while
+    the rest of the completion arrives. With stop_at_pause, the stream is closed at
+    PAUSE, which cancels the rest of the generation (the model would only go on
+    with text the loop doesn't use, often a made up Observation)."""
+    executor = executor or _executor
+    parser = ActionParser()
+    result, action_at, cancelled = None, None, False
+    start = time.perf_counter()
+
+    def dispatch():
+        nonlocal result, action_at
+        action_at = time.perf_counter() - start
+        name, action_input = parser.action
+        if name in actions:
+            result = executor.submit(actions[name], action_input)
+
+    try:
+        for chunk in stream:
+            if not chunk.choices or not chunk.choices[0].delta.content:
+                continue
+            paused = parser.feed(chunk.choices[0].delta.content)
+            if parser.action and action_at is None:
+                dispatch()
+            if paused and stop_at_pause:
+                cancelled = True
+                break
+    finally:
+        stream.close()
+    if parser.close() and action_at is None:  # the Action line was the last one
+        dispatch()
+    return StreamedTurn(parser.response(), parser.action, result, cancelled, action_at)
+
+
+# Conversation memory
+def compact_turns(summary, messages):
+    """Rolling summary without an LLM call: summary plus the questions, actions,
+    observations (first 200 characters) and answers of messages, thoughts dropped."""
+    lines = [summary] if summary else []
+    for message in messages:
+        content = message["content"] or ""
+        if message["role"] == "user":
+            if content.startswith("Observation:"):
+                lines.append(content.splitlines()[0][:200])
+            else:
+                lines.append(f"Question: {content.strip()}")
+            continue
+        lines.extend(line.strip() for line in content.splitlines() if line.startswith(("Action:", "Answer:")))
+    return "\n".join(lines)
+
+
+def llm_summarizer(client, model="gpt-3.5-turbo", max_tokens=200):
+    """summarize function for ConversationMemory asking model (one more call per
+    compaction) to fold the messages into the summary."""
+    def summarize(summary, messages):
+        transcript = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+        completion = client.chat.completions.create(
+            model=model, temperature=0, max_tokens=max_tokens,
+            messages=[{"role": "system", "content": "Update the summary of a question answering session with the "
+                                                    "new messages. Keep the question, facts found and results, "
+                                                    "briefly."},
+                      {"role": "user", "content": f"Summary:\n{summary}\n\nNew messages:\n{transcript}"}])
+        return completion.choices[0].message.content
+    return summarize
+
+
+class TurnTokens(NamedTuple):
+    sent: int  # tokens of the messages sent
+    full: int  # tokens of the whole conversation, what was sent before
+    summary: int  # tokens of the summary, part of sent
+    compacted: int  # messages summarized or dropped so far
+
+    def report(self):
+        return (f"tokens: {self.sent}/{self.full} sent ({self.full - self.sent} saved, summary {self.summary}, "
+                f"{self.compacted} messages compacted)")
+
+
+class ConversationMemory:
+    """The messages lesson 1's Agent sends, within token_budget (None: no limit).
+
+    transcript is the whole conversation, system message first, as a plain list
+    (the Agent's messages): messages are appended to it and it is never compacted.
+    What is sent is a view of it: the system message, the first user message (the
+    question), a rolling summary of the earlier turns, and the turns after them.
+    The last keep_turns turns (a response and its observation) are always sent.
+    When a request is over budget, its oldest turns are folded into the summary by
+    summarize(summary, messages) (compact_turns, llm_summarizer, or None to drop
+    them); the summary keeps to half the budget, its oldest lines dropped.
+    Compacting only happens in next_request(), which also appends a TurnTokens to
+    reports."""
+
+    SUMMARY = "Summary of the earlier turns:\n"
+
+    def __init__(self, system_message="", token_budget=None, keep_turns=2, summarize=compact_turns,
+                 model="gpt-3.5-turbo"):
+        self.token_budget = token_budget
+        self.keep_turns = keep_turns
+        self.summarize = summarize
+        self.model = model
+        self.transcript = [{"role": "system", "content": system_message}] if system_message else []
+        self.compacted = 0  # messages after the question summarized or dropped so far
+        self.summary = ""
+        self.summary_tokens = 0
+        self.reports = []
+        self._tokens = []  # tokens of each message of transcript counted so far
+
+    def tokens(self, message):
+        return count_tokens(message["content"] or "", self.model) + 4  # + role and separators
+
+    def _head(self):
+        # the system message and the question, always sent
+        for i, message in enumerate(self.transcript):
+            if message["role"] == "user":
+                return i + 1
+        return len(self.transcript)
+
+    def messages(self):
+        """The messages a request would send now (the view as last compacted)."""
+        head = self._head()
+        summary = [{"role": "system", "content": self.SUMMARY + self.summary}] if self.summary else []
+        return self.transcript[:head] + summary + self.transcript[head + self.compacted:]
+
+    def _sent_tokens(self, head):
+        return sum(self._tokens[:head]) + self.summary_tokens + sum(self._tokens[head + self.compacted:])
+
+    def _compact(self, head):
+        # a turn is a response and the observation after it, the last message (not answered yet) stays
+        while (self.token_budget is not None and self._sent_tokens(head) > self.token_budget
+               and len(self.transcript) - head - self.compacted >= 2 * self.keep_turns + 2):
+            start = head + self.compacted
+            old = self.transcript[start:start + 2]
+            self.compacted += len(old)
+            if self.summarize is not None:
+                self.summary = self.summarize(self.summary, old)
+                self.summary_tokens = self._summary_tokens()
+                # the summary gets half the budget at most: its oldest lines go first
+                while self.summary_tokens > self.token_budget // 2 and "\n" in self.summary:
+                    self.summary = self.summary.partition("\n")[2]
+                    self.summary_tokens = self._summary_tokens()
+
+    def _summary_tokens(self):
+        return self.tokens({"content": self.SUMMARY + self.summary})
+
+    def next_request(self):
+        """messages() for a request: the messages added since the last one are counted,
+        the oldest turns compacted if over budget, the tokens added to reports."""
+        self._tokens.extend(self.tokens(m) for m in self.transcript[len(self._tokens):])
+        head = self._head()
+        self._compact(head)
+        self.reports.append(TurnTokens(self._sent_tokens(head), sum(self._tokens), self.summary_tokens,
+                                       self.compacted))
+        return self.messages()
+
+    @property
+    def last(self):
+        return self.reports[-1] if self.reports else None
@@ -0,0 +1,203 @@
+"""Web scraping helpers for the search lesson (3)."""
+import codecs
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from html.parser import HTMLParser
+from typing import Any, NamedTuple, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class Page(NamedTuple):
+    url: str
+    status: Optional[int]
+    value: Any  # what extract returned, None if the page failed
+    size: int  # bytes read
+    truncated: bool  # body cut at max_bytes
+    elapsed: float  # seconds, fetch and extract
+    error: Optional[str]
+
+
+class PooledScraper:
+    """Fetches pages over one pooled keep-alive requests.Session. Safe to share between threads.
+
+    Every request has a (connect, read) timeout, at most per_host requests go to the
+    same host at once, and bodies are read up to max_bytes (the rest is not downloaded,
+    Page.truncated tells). Works with any http(s) URL, e.g. a local fixture server
+    (see benchmarks/).
+    """
+
+    HEADERS = {'User-Agent': 'Mozilla/5.0'}
+
+    def __init__(self, pool_size=16, per_host=2, timeout=(5, 15), max_bytes=2 * 1024 * 1024, headers=None):
+        self.per_host = per_host
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.session = requests.Session()
+        self.session.headers.update(headers or self.HEADERS)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._hosts = {}  # host -> semaphore of its requests in flight
+        self._lock = threading.Lock()
+
+    def _host_slots(self, url):
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._hosts:
+                self._hosts[host] = threading.BoundedSemaphore(self.per_host)
+            return self._hosts[host]
+
+    @contextmanager
+    def open(self, url):
+        """(response, body) of url, body iterates over the decoded text as it is
+        downloaded, up to max_bytes. Raises the requests exceptions (timeouts,
+        connection errors). What isn't read when the block exits is not downloaded."""
+        with self._host_slots(url):
+            with self.session.get(url, timeout=self.timeout, stream=True) as response:
+                yield response, Body(response, self.max_bytes)
+
+    def fetch(self, url):
+        """(status, text, bytes read, truncated) of url, the body read up to max_bytes."""
+        with self.open(url) as (response, body):
+            text = "".join(body)
+            return response.status_code, text, body.size, body.truncated
+
+    def scrape(self, url, extract, stream=False):
+        """Fetches url and returns a Page with extract(text) as value. With stream,
+        extract gets the body's text chunks as they arrive instead, and can stop
+        early. Failures (HTTP errors, timeouts, extract errors) are returned in
+        Page.error, not raised."""
+        start = time.perf_counter()
+        status, size, truncated = None, 0, False
+        try:
+            if stream:
+                with self.open(url) as (response, body):
+                    status = response.status_code
+                    if status != 200:
+                        raise ValueError(f"HTTP {status}")
+                    value = extract(body)
+                    size, truncated = body.size, body.truncated
+            else:
+                status, text, size, truncated = self.fetch(url)
+                if status != 200:
+                    raise ValueError(f"HTTP {status}")
+                value = extract(text)
+            error = None
+        except Exception as e:
+            value, error = None, f"{type(e).__name__}: {e}"
+        return Page(url, status, value, size, truncated, time.perf_counter() - start, error)
+
+    def scrape_all(self, urls, extract, max_workers=8, stream=False):
+        """Scrapes urls concurrently and yields their Pages as they complete, so each
+        page is extracted as soon as it arrives (in a worker thread) and the caller
+        can use it while the others download. See scrape for stream."""
+        urls = list(urls)
+        if not urls:
+            return
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(urls)))) as executor:
+            futures = [executor.submit(self.scrape, url, extract, stream) for url in urls]
+            for future in as_completed(futures):
+                yield future.result()
+
+    def close(self):
+        self.session.close()
+
+
+class Body:
+    """Decoded text chunks of a streamed response, read up to max_bytes."""
+
+    def __init__(self, response, max_bytes, chunk_size=64 * 1024):
+        self.response = response
+        self.max_bytes = max_bytes
+        self.chunk_size = chunk_size
+        self.size = 0
+        self.truncated = False
+
+    def __iter__(self):
+        decoder = codecs.getincrementaldecoder(self.response.encoding or "utf-8")(errors="replace")
+        for chunk in self.response.iter_content(self.chunk_size):
+            if self.size + len(chunk) > self.max_bytes:
+                chunk = chunk[:self.max_bytes - self.size]
+                self.truncated = True
+            self.size += len(chunk)
+            yield decoder.decode(chunk)
+            if self.truncated:
+                break
+        yield decoder.decode(b"", final=True)
+
+
+# Text extraction
+class TextExtractor(HTMLParser):
+    """Incremental HTML parser that keeps only the text inside `tags` (headings and
+    paragraphs), whitespace collapsed, and nothing of scripts and styles. No tree
+    is built: feed() it the page in chunks, text() is what was kept so far.
+    done is set once max_chars are kept, the rest of the page can be skipped."""
+
+    TAGS = ("h1", "h2", "h3", "p")
+    SKIP = ("script", "style", "noscript", "template")
+
+    def __init__(self, tags=TAGS, max_chars=None):
+        super().__init__(convert_charrefs=True)
+        self.tags = set(tags)
+        self.max_chars = max_chars
+        self.depth = 0  # open tags of self.tags
+        self.skip = 0  # open script/style tags
+        self.parts = []
+        self.pending = []  # text since the last tag, may be split across fed chunks
+        self.chars = 0
+        self.done = False
+
+    def flush(self):
+        text = " ".join("".join(self.pending).split())
+        self.pending = []
+        if text and not self.done:
+            self.parts.append(text)
+            self.chars += len(text) + 1
+            if self.max_chars is not None and self.chars >= self.max_chars:
+                self.done = True
+
+    def handle_starttag(self, tag, attrs):
+        self.flush()
+        if tag in self.tags:
+            self.depth += 1
+        elif tag in self.SKIP:
+            self.skip += 1
+
+    def handle_endtag(self, tag):
+        self.flush()
+        if tag in self.tags and self.depth:
+            self.depth -= 1
+        elif tag in self.SKIP and self.skip:
+            self.skip -= 1
+
+    def handle_data(self, data):
+        if self.depth and not self.skip and not self.done:
+            self.pending.append(data)
+
+    def handle_comment(self, data):
+        self.flush()
+
+    def text(self):
+        self.flush()
+        text = " ".join(self.parts)
+        return text[:self.max_chars] if self.max_chars is not None else text
+
+
+def extract_text(chunks, tags=TextExtractor.TAGS, max_chars=None):
+    """Heading and paragraph text of a page given as text chunks (e.g. a Body, or a
+    whole page as one string), reading no further than needed for max_chars."""
+    parser = TextExtractor(tags, max_chars)
+    if isinstance(chunks, str):
+        chunks = [chunks]
+    for chunk in chunks:
+        parser.feed(chunk)
+        if parser.done:
+            break
+    else:
+        parser.close()
+    return parser.text()
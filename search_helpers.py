@@ -0,0 +1,360 @@
+"""Search helpers shared by the search lessons (3) and the essay writer (lesson 6)."""
+import asyncio
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+TAVILY_URL = "https://api.tavily.com"
+
+
+class PooledTavilyClient:
+    """Drop-in replacement for TavilyClient.search that reuses keep-alive
+    connections from one pooled requests.Session. Safe to share between threads.
+    base_url can point to a local stub server (see benchmarks/)."""
+
+    def __init__(self, api_key, base_url=TAVILY_URL, pool_size=8, timeout=30):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def search(self, query, search_depth="basic", max_results=5, include_answer=False,
+               include_raw_content=False, include_images=False, **kwargs):
+        data = {
+            "api_key": self.api_key,
+            "query": query,
+            "search_depth": search_depth,
+            "max_results": max_results,
+            "include_answer": include_answer,
+            "include_raw_content": include_raw_content,
+            "include_images": include_images,
+            **kwargs,
+        }
+        response = self.session.post(f"{self.base_url}/search", json=data, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def close(self):
+        self.session.close()
+
+
+def search_all(client, queries, max_results=2, max_concurrency=4):
+    """Runs client.search for every query concurrently (at most max_concurrency
+    at a time) and returns the responses in the same order as queries."""
+    if not queries:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(queries)))) as executor:
+        return list(executor.map(lambda q: client.search(query=q, max_results=max_results), queries))
+
+
+async def asearch_all(client, queries, max_results=2, max_concurrency=4):
+    """Async search_all. The clients are blocking (requests), so each search runs
+    in a thread (asyncio.to_thread) and the event loop keeps serving meanwhile."""
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def search(q):
+        async with semaphore:
+            return await asyncio.to_thread(client.search, query=q, max_results=max_results)
+
+    return list(await asyncio.gather(*(search(q) for q in queries)))
+
+
+def _merge_content(responses):
+    content = []
+    for response in responses:
+        for r in response['results']:
+            content.append(r['content'])
+    return content
+
+
+def research_content(client, queries, max_results=2, max_concurrency=4):
+    """Content snippets for queries, merged in query order then result order,
+    so the same queries always give the same content list."""
+    return _merge_content(search_all(client, queries, max_results, max_concurrency))
+
+
+async def aresearch_content(client, queries, max_results=2, max_concurrency=4):
+    """Async research_content, same order of the content list."""
+    return _merge_content(await asearch_all(client, queries, max_results, max_concurrency))
+
+
+# Search result cache
+def normalize_query(query):
+    return re.sub(r"\s+", " ", query).strip().lower()
+
+
+class SearchCache:
+    """Search results keyed on provider + normalized query + search parameters.
+
+    Two tiers: an in-memory LRU (maxsize entries) and, when path is given, a SQLite
+    table that survives restarts and can be shared by processes. Entries expire
+    after ttl seconds. Values must be JSON serializable (search results are).
+    """
+
+    def __init__(self, maxsize=256, ttl=3600, path=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lru = OrderedDict()  # key -> (expires, value)
+        self._lock = threading.Lock()
+        self._conn = None
+        if path:
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute("CREATE TABLE IF NOT EXISTS search_cache "
+                               "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL)")
+            self._conn.commit()
+
+    @staticmethod
+    def key(provider, query, **params):
+        raw = json.dumps([provider, normalize_query(query), params], sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def get(self, key):
+        """Cached value for key, or None if missing or expired."""
+        return self._get(key, count=True)
+
+    def peek(self, key):
+        """get without counting a hit or miss (fallback lookups that aren't cache traffic)."""
+        return self._get(key, count=False)
+
+    def _get(self, key, count):
+        now = time.time()
+        with self._lock:
+            entry = self._lru.get(key)
+            if entry is None and self._conn is not None:
+                row = self._conn.execute("SELECT expires, value FROM search_cache WHERE key = ?",
+                                         (key,)).fetchone()
+                if row:
+                    entry = (row[0], json.loads(row[1]))
+                    self._lru[key] = entry
+            if entry is None or entry[0] < now:
+                if entry is not None:
+                    self._delete(key)
+                self.misses += count
+                return None
+            self._lru.move_to_end(key)
+            self._trim()  # SQLite hits are added to the LRU too
+            self.hits += count
+            return entry[1]
+
+    def set(self, key, value, ttl=None):
+        expires = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._lru[key] = (expires, value)
+            self._lru.move_to_end(key)
+            self._trim()
+            if self._conn is not None:
+                self._conn.execute("INSERT OR REPLACE INTO search_cache (key, value, expires) VALUES (?, ?, ?)",
+                                   (key, json.dumps(value), expires))
+                self._conn.commit()
+
+    def _trim(self):
+        while len(self._lru) > self.maxsize:
+            self._lru.popitem(last=False)  # evict least recently used
+
+    def _delete(self, key):
+        self._lru.pop(key, None)
+        if self._conn is not None:
+            self._conn.execute("DELETE FROM search_cache WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def cached(self, provider, fn, query, **params):
+        """Returns the cached results for this search, or calls fn() and caches them."""
+        key = self.key(provider, query, **params)
+        value = self.get(key)
+        if value is None:
+            value = fn()
+            self.set(key, value)
+        return value
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._lru),
+                "hit_rate": self.hits / total if total else 0.0}
+
+
+class CachedSearch:
+    """Wraps any client with a TavilyClient-like search(query, **params) method
+    (TavilyClient, PooledTavilyClient) so repeated searches come from a SearchCache."""
+
+    def __init__(self, client, cache, provider="tavily"):
+        self.client = client
+        self.cache = cache
+        self.provider = provider
+
+    def search(self, query, **params):
+        return self.cache.cached(self.provider, lambda: self.client.search(query=query, **params),
+                                 query, **params)
+
+
+# Fallback across search providers
+class CircuitBreaker:
+    """Stops calling a failing provider. After `failures` failures in a row the
+    breaker opens: calls are refused (allow() is False) for `timeout` seconds.
+    Then it is half open, one probe call is let through: if it succeeds the
+    breaker closes, if it fails it opens again for twice as long (exponential
+    backoff, up to max_timeout). Safe to share between threads."""
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failures=3, timeout=30, max_timeout=600, clock=time.monotonic):
+        self.failures = failures
+        self.base_timeout = timeout
+        self.max_timeout = max_timeout
+        self.clock = clock
+        self.timeout = timeout
+        self.failed = 0  # failures in a row
+        self.opened_at = None
+        self.probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return self.CLOSED
+        if self.probing or self.clock() - self.opened_at >= self.timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self.probing:
+                self.probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failed = 0
+            self.opened_at = None
+            self.probing = False
+            self.timeout = self.base_timeout
+
+    def record_failure(self):
+        with self._lock:
+            self.failed += 1
+            if self.probing:
+                self.timeout = min(self.timeout * 2, self.max_timeout)
+            if self.probing or self.failed >= self.failures:
+                self.opened_at = self.clock()
+            self.probing = False
+
+
+class SearchBackend:
+    """A search provider: search(query, max_results) returns results as
+    {"url", "title", "content"} dicts. Keeps a circuit breaker and the
+    provider's latency and call counts."""
+
+    def __init__(self, name, search, breaker=None):
+        self.name = name
+        self._search = search
+        self.breaker = breaker or CircuitBreaker()
+        self.calls = 0
+        self.errors = 0
+        self.rejected = 0  # calls not made, breaker open
+        self.last_error = None
+        self.latencies = deque(maxlen=100)  # s, of the last calls
+
+    def search(self, query, max_results=5):
+        start = time.perf_counter()
+        self.calls += 1
+        try:
+            results = self._search(query, max_results)
+        except Exception as e:
+            self.errors += 1
+            self.last_error = f"{type(e).__name__}: {e}"
+            self.breaker.record_failure()
+            raise
+        finally:
+            self.latencies.append(time.perf_counter() - start)
+        self.breaker.record_success()
+        return results
+
+    def metrics(self):
+        latencies = sorted(self.latencies)
+        return {"state": self.breaker.state, "calls": self.calls, "errors": self.errors,
+                "rejected": self.rejected, "last_error": self.last_error,
+                "p50_ms": latencies[len(latencies) // 2] * 1e3 if latencies else None,
+                "max_ms": latencies[-1] * 1e3 if latencies else None}
+
+
+def ddg_backend(ddg, **breaker_args):
+    """SearchBackend over a duckduckgo_search DDGS."""
+    def search(query, max_results):
+        return [{"url": r["href"], "title": r.get("title", ""), "content": r.get("body", "")}
+                for r in ddg.text(query, max_results=max_results)]
+    return SearchBackend("ddg", search, CircuitBreaker(**breaker_args))
+
+
+def tavily_backend(client, **breaker_args):
+    """SearchBackend over a TavilyClient (or PooledTavilyClient)."""
+    def search(query, max_results):
+        return [{"url": r["url"], "title": r.get("title", ""), "content": r.get("content", "")}
+                for r in client.search(query=query, max_results=max_results)["results"]]
+    return SearchBackend("tavily", search, CircuitBreaker(**breaker_args))
+
+
+class FallbackSearch:
+    """Searches the first of backends whose breaker lets the call through and
+    that answers, so a rate limited provider costs one failed call and is then
+    skipped until its breaker half opens. With a SearchCache, results are cached
+    (ttl of the cache), and when every backend fails the last results found for
+    the query are returned, however old (up to stale_ttl). Then source is "stale".
+    [] if there are none.
+
+    search returns the results, last_source tells which backend or cache
+    answered and metrics() the breakers' states and latencies."""
+
+    def __init__(self, backends, cache=None, stale_ttl=30 * 24 * 3600):
+        self.backends = list(backends)
+        self.cache = cache
+        self.stale_ttl = stale_ttl
+        self.last_source = None
+        self.sources = {}  # source -> searches it answered
+
+    def _answered(self, source, results):
+        self.last_source = source
+        self.sources[source] = self.sources.get(source, 0) + 1
+        return results
+
+    def search(self, query, max_results=5):
+        key = stale_key = None
+        if self.cache is not None:
+            key = self.cache.key("search", query, max_results=max_results)
+            stale_key = self.cache.key("search:stale", query, max_results=max_results)
+            results = self.cache.get(key)
+            if results is not None:
+                return self._answered("cache", results)
+        for backend in self.backends:
+            if not backend.breaker.allow():
+                backend.rejected += 1
+                continue
+            try:
+                results = backend.search(query, max_results)
+            except Exception:
+                continue
+            if self.cache is not None:
+                self.cache.set(key, results)
+                self.cache.set(stale_key, results, ttl=self.stale_ttl)
+            return self._answered(backend.name, results)
+        results = self.cache.peek(stale_key) if self.cache is not None else None  # not a cache lookup of its own
+        return self._answered("stale" if results is not None else None, results or [])
+
+    def metrics(self):
+        return {"backends": {backend.name: backend.metrics() for backend in self.backends},
+                "sources": dict(self.sources)}